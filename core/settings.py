@@ -39,6 +39,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Compress HTML/CSV/PDF responses; must run before middleware that touches the body
+    'django.middleware.gzip.GZipMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -141,4 +143,20 @@ else:
     X_FRAME_OPTIONS = 'SAMEORIGIN'
 
 # Logging configuration
-# LOGGING removed - django.log is no longer used
+# LOGGING removed - django.log is no longer used; app loggers write to the console.
+# Set SALES_LOG_LEVEL=DEBUG to see the sales views' form and formset diagnostics.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'sales': {
+            'handlers': ['console'],
+            'level': os.environ.get('SALES_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
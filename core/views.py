@@ -81,7 +81,7 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         context['recent_purchases'] = PurchaseOrder.objects.select_related('supplier').order_by('-created_at')[:5]
         
         # Low stock alerts (calculated dynamically)
-        context['low_stock_alerts'] = get_low_stock_products()[:5]
+        context['low_stock_alerts'] = get_low_stock_products(limit=5)
         
         # Top customers by balance
         context['top_customers'] = Customer.objects.filter(
@@ -162,5 +162,5 @@ def dashboard_redirect(request):
         'total_products': Product.objects.count(),
         'total_sales': SalesOrder.objects.filter(status='delivered').aggregate(total=Sum('total_amount'))['total'] or 0,
         'recent_orders': SalesOrder.objects.select_related('customer').order_by('-created_at')[:5],
-        'low_stock_alerts': get_low_stock_products()[:5],
+        'low_stock_alerts': get_low_stock_products(limit=5),
     })
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-15 22:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customerledger',
+            index=models.Index(fields=['transaction_type', 'transaction_date'], name='customers_c_transac_33519a_idx'),
+        ),
+    ]
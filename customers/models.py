@@ -25,6 +25,18 @@ class Customer(models.Model):
     def __str__(self):
         return f"{self.name} ({self.customer_type})"
     
+    def adjust_balance(self, amount):
+        """
+        Add amount to current balance (negative to reduce it) in a single UPDATE,
+        so concurrent orders for the same customer can't overwrite each other
+        """
+        Customer.objects.filter(pk=self.pk).update(
+            current_balance=models.F('current_balance') + amount,
+            updated_at=timezone.now()
+        )
+        # Keep this instance in step for anything that reads or saves it later
+        self.current_balance += amount
+    
     def set_opening_balance(self, amount, user=None):
         """Set opening balance and create ledger entry"""
         self.opening_balance = amount
@@ -88,6 +100,9 @@ class CustomerLedger(models.Model):
         verbose_name = "Customer Ledger"
         verbose_name_plural = "Customer Ledgers"
         ordering = ['-transaction_date', '-id']
+        indexes = [
+            models.Index(fields=['transaction_type', 'transaction_date']),
+        ]
 
 
 
@@ -74,6 +74,17 @@ class CustomerModelTest(TestCase):
         self.assertEqual(ledger_entry.amount, amount)
         self.assertEqual(ledger_entry.created_by, user)
         self.assertEqual(ledger_entry.reference, "OPENING")
+    
+    def test_adjust_balance(self):
+        """Test balance adjustments apply on top of the stored balance"""
+        # A stale copy, as a concurrent request would hold
+        stale = Customer.objects.get(pk=self.customer.pk)
+        self.customer.adjust_balance(Decimal('100.00'))
+        stale.adjust_balance(Decimal('-30.00'))
+        
+        self.assertEqual(self.customer.current_balance, Decimal('100.00'))
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.current_balance, Decimal('70.00'))
 
 
 class CustomerLedgerModelTest(TestCase):
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-15 22:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['status', 'expense_date'], name='expenses_ex_status_33d883_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['expense_date', 'category'], name='expenses_ex_expense_b82ea3_idx'),
+        ),
+    ]
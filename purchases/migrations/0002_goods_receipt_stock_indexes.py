@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-15 23:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchases', '0001_initial'),
+        ('stock', '0006_product_is_tile'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='goodsreceipt',
+            index=models.Index(fields=['status'], name='purchases_g_status_fdb441_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='goodsreceiptitem',
+            index=models.Index(fields=['product', 'goods_receipt'], name='purchases_g_product_d94410_idx'),
+        ),
+    ]
@@ -157,6 +157,9 @@ class GoodsReceipt(models.Model):
         verbose_name = "Goods Receipt"
         verbose_name_plural = "Goods Receipts"
         ordering = ['-receipt_date', '-created_at']
+        indexes = [
+            models.Index(fields=['status']),
+        ]
 
 
 class GoodsReceiptItem(models.Model):
@@ -189,5 +192,9 @@ class GoodsReceiptItem(models.Model):
     class Meta:
         verbose_name = "Goods Receipt Item"
         verbose_name_plural = "Goods Receipt Items"
+        indexes = [
+            # Received quantity per product, joined to the receipt for its status
+            models.Index(fields=['product', 'goods_receipt']),
+        ]
 
 
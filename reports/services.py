@@ -0,0 +1,81 @@
+"""
+Report data builders shared by the report views and their downloads
+"""
+from datetime import datetime
+from decimal import Decimal
+
+from django.db.models import Sum, Count
+from django.utils import timezone
+
+from customers.models import CustomerLedger
+from suppliers.models import SupplierLedger
+from expenses.models import Expense
+
+
+def build_financial_flow_context(start_date, end_date):
+    """
+    Build the inflow/outflow figures for the financial flow report.
+
+    Inflow is customer payments, outflow is supplier payments plus paid
+    expenses, all within the given date range (inclusive).
+
+    Returns:
+        dict: Template context with the per-customer/supplier/expense
+        breakdowns, their totals and the net flow.
+    """
+    # Ledger entries are timestamped, so cover the whole of both end days
+    start_datetime = timezone.make_aware(datetime.combine(start_date, datetime.min.time()))
+    end_datetime = timezone.make_aware(datetime.combine(end_date, datetime.max.time()))
+
+    # Inflow: Cash/Bank received from customers
+    customer_payments_qs = CustomerLedger.objects.filter(
+        transaction_type='payment',
+        transaction_date__range=[start_datetime, end_datetime]
+    )
+
+    total_inflow = customer_payments_qs.aggregate(total=Sum('amount'))['total'] or Decimal('0')
+
+    inflow_by_customer = customer_payments_qs.values('customer__name').annotate(
+        total=Sum('amount'),
+        payments=Count('id')
+    ).order_by('-total')
+
+    # Outflow: Cash/Bank paid to suppliers
+    supplier_payments_qs = SupplierLedger.objects.filter(
+        transaction_type='payment',
+        transaction_date__range=[start_datetime, end_datetime]
+    )
+
+    total_outflow_suppliers = supplier_payments_qs.aggregate(total=Sum('amount'))['total'] or Decimal('0')
+
+    outflow_by_supplier = supplier_payments_qs.values('supplier__name').annotate(
+        total=Sum('amount'),
+        payments=Count('id')
+    ).order_by('-total')
+
+    # Expenses by title (only paid expenses)
+    expenses_qs = Expense.objects.filter(
+        status='paid',
+        expense_date__range=[start_date, end_date]
+    )
+
+    total_expenses = expenses_qs.aggregate(total=Sum('amount'))['total'] or Decimal('0')
+
+    expenses_by_title = expenses_qs.values('title').annotate(
+        total=Sum('amount'),
+        count=Count('id')
+    ).order_by('-total')
+
+    net_flow = total_inflow - (total_outflow_suppliers + total_expenses)
+
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'inflow_by_customer': inflow_by_customer,
+        'outflow_by_supplier': outflow_by_supplier,
+        'expenses_by_title': expenses_by_title,
+        'total_inflow': total_inflow,
+        'total_outflow_suppliers': total_outflow_suppliers,
+        'total_expenses': total_expenses,
+        'net_flow': net_flow,
+    }
@@ -0,0 +1,199 @@
+"""
+Test cases for the Reports module
+"""
+
+import csv
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import TestCase, RequestFactory
+from django.urls import reverse
+from django.utils import timezone
+
+from customers.models import Customer
+from expenses.models import Expense, ExpenseCategory
+from reports.views import _parse_range
+from sales.models import SalesOrder, SalesOrderItem
+from stock.models import Product, UnitType
+
+
+def csv_rows(response):
+    """Rows of a CSV download, as lists of strings"""
+    return list(csv.reader(response.content.decode().splitlines()))
+
+
+class ReportDateRangeTests(TestCase):
+    """Test cases for parsing the report start/end date query parameters"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def _range(self, params=None, **kwargs):
+        return _parse_range(self.factory.get('/reports/', params or {}), **kwargs)
+
+    def test_valid_range(self):
+        """Test valid dates are used as given"""
+        self.assertEqual(
+            self._range({'start_date': '2026-01-05', 'end_date': '2026-02-10'}),
+            (date(2026, 1, 5), date(2026, 2, 10))
+        )
+
+    def test_missing_dates_default_to_recent_days(self):
+        """Test missing dates cover the last default_days days up to today"""
+        today = timezone.now().date()
+        self.assertEqual(self._range(), (today - timedelta(days=30), today))
+        self.assertEqual(self._range(default_days=7), (today - timedelta(days=7), today))
+
+    def test_invalid_dates_fall_back_to_defaults(self):
+        """Test malformed and impossible dates are treated as missing"""
+        today = timezone.now().date()
+        for start, end in [('bad', 'worse'), ('2026-13-45', '2026-02-30'), ('', '')]:
+            with self.subTest(start=start, end=end):
+                self.assertEqual(
+                    self._range({'start_date': start, 'end_date': end}),
+                    (today - timedelta(days=30), today)
+                )
+        # Each date falls back on its own
+        self.assertEqual(
+            self._range({'start_date': '2026-01-05', 'end_date': 'bad'}),
+            (date(2026, 1, 5), today)
+        )
+
+    def test_default_start(self):
+        """Test default_start replaces the rolling window for a missing or invalid start date only"""
+        first = date(2026, 3, 1)
+        today = timezone.now().date()
+        self.assertEqual(self._range(default_start=first), (first, today))
+        self.assertEqual(self._range({'start_date': 'bad'}, default_start=first), (first, today))
+        self.assertEqual(
+            self._range({'start_date': '2026-01-05'}, default_start=first),
+            (date(2026, 1, 5), today)
+        )
+
+
+class ProfitLossReportTests(TestCase):
+    """Test cases for the profit & loss expense figures on the page and in the CSV"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='accountant', password='testpass123')
+        SalesOrder.objects.create(
+            order_number='SO-PL', order_date=date(2026, 3, 10), status='delivered', total_amount=Decimal('1000.00')
+        )
+        rent = ExpenseCategory.objects.create(name='Rent')
+        fuel = ExpenseCategory.objects.create(name='Fuel')
+        for title, category, amount, day in [
+            ('March rent', rent, '100.00', date(2026, 3, 1)),
+            ('Store rent', rent, '50.00', date(2026, 3, 20)),
+            ('Van fuel', fuel, '30.00', date(2026, 3, 5)),
+            ('Sundries', None, '20.00', date(2026, 3, 31)),
+            ('April rent', rent, '999.00', date(2026, 4, 1)),  # Outside the period
+        ]:
+            Expense.objects.create(title=title, category=category, amount=Decimal(amount), expense_date=day)
+        cls.params = {'start_date': '2026-03-01', 'end_date': '2026-03-31'}
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_page_expenses_by_category(self):
+        """Test the page groups the period's expenses by category, largest first, with their total"""
+        context = self.client.get(reverse('reports:profit_loss'), self.params).context
+        self.assertEqual(
+            [(e['category__name'], e['total'], e['percentage']) for e in context['expenses_by_category']],
+            [('Rent', Decimal('150'), Decimal('15')), ('Fuel', Decimal('30'), Decimal('3')), (None, Decimal('20'), Decimal('2'))]
+        )
+        self.assertEqual(context['operating_expenses'], Decimal('200'))
+        self.assertEqual(context['net_profit'], Decimal('800'))
+
+    def test_csv_expenses_by_category(self):
+        """Test the CSV lists the same category totals, uncategorized expenses by name, and the total"""
+        rows = csv_rows(self.client.get(reverse('reports:download_profit_loss_csv'), self.params))
+        start = rows.index(['OPERATING EXPENSES']) + 1
+        end = start + rows[start:].index([])
+        self.assertEqual(
+            [(name, Decimal(amount)) for name, amount in rows[start:end]],
+            [('Rent', Decimal('150')), ('Fuel', Decimal('30')), ('Uncategorized', Decimal('20')),
+             ('Total Operating Expenses', Decimal('200'))]
+        )
+        self.assertEqual(rows[-1][0], 'NET PROFIT')
+        self.assertEqual(Decimal(rows[-1][1]), Decimal('800'))
+
+
+class TopProductsCsvTests(TestCase):
+    """Test cases for the top selling products CSV download"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='analyst', password='testpass123')
+        unit_type = UnitType.objects.create(code='pcs', name='Pieces')
+        tile = Product.objects.create(name='Floor Tile', unit_type=unit_type)
+        paint = Product.objects.create(name='Wall Paint', unit_type=unit_type)
+        first = SalesOrder.objects.create(order_number='SO-TP1', order_date=date(2026, 3, 2), status='delivered')
+        second = SalesOrder.objects.create(order_number='SO-TP2', order_date=date(2026, 3, 9), status='delivered')
+        pending = SalesOrder.objects.create(order_number='SO-TP3', order_date=date(2026, 3, 9), status='order')
+        for order, product, quantity, unit_price in [
+            (first, tile, '2.50', '40.10'),
+            (second, tile, '1.50', '40.10'),
+            (first, paint, '3.00', '75.55'),
+            (pending, paint, '100.00', '75.55'),  # Not delivered
+        ]:
+            quantity, unit_price = Decimal(quantity), Decimal(unit_price)
+            SalesOrderItem.objects.create(
+                sales_order=order, product=product, quantity=quantity,
+                unit_price=unit_price, total_price=quantity * unit_price
+            )
+
+    def test_rows_ordered_by_value(self):
+        """Test each product's delivered quantity, value and line count, highest value first"""
+        self.client.force_login(self.user)
+        rows = csv_rows(self.client.get(
+            reverse('reports:download_top_products_csv'),
+            {'start_date': '2026-03-01', 'end_date': '2026-03-31'}
+        ))
+        header = rows.index(['Product Name', 'Total Quantity', 'Total Value', 'Orders'])
+        self.assertEqual(
+            [[name, Decimal(quantity), Decimal(value), orders] for name, quantity, value, orders in rows[header + 1:]],
+            [['Wall Paint', Decimal('3.00'), Decimal('226.65'), '1'],
+             ['Floor Tile', Decimal('4.00'), Decimal('160.40'), '2']]
+        )
+        # Quantities and values are written to the cent, whatever the backend returns
+        for row in rows[header + 1:]:
+            self.assertRegex(row[1], r'^\d+\.\d{2}$')
+            self.assertRegex(row[2], r'^\d+\.\d{2}$')
+
+
+class SalesReportCsvTests(TestCase):
+    """Test cases for the sales report CSV download"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='analyst', password='testpass123')
+        customer = Customer.objects.create(name='Rahim Traders', phone='1234567890')
+        SalesOrder.objects.create(
+            order_number='SO-SR1', customer=customer, order_date=date(2026, 3, 2),
+            status='delivered', total_amount=Decimal('250.50')
+        )
+        SalesOrder.objects.create(
+            order_number='IS-SR2', sales_type='instant', order_date=date(2026, 3, 3),
+            status='delivered', total_amount=Decimal('99.50')
+        )
+        SalesOrder.objects.create(
+            order_number='SO-SR3', customer=customer, order_date=date(2026, 3, 4),
+            status='order', total_amount=Decimal('500.00')
+        )
+
+    def test_report_rows(self):
+        """Test the header, the summary footer and one row per delivered order"""
+        self.client.force_login(self.user)
+        rows = csv_rows(self.client.get(
+            reverse('reports:download_sales_csv'),
+            {'start_date': '2026-03-01', 'end_date': '2026-03-31'}
+        ))
+        self.assertEqual(rows[:3], [['SALES REPORT'], ['Period: 2026-03-01 to 2026-03-31'], []])
+        self.assertEqual(rows[3:5], [['Total Sales', '350.00'], ['Total Orders', '2']])
+        header = rows.index(['Order Number', 'Customer', 'Date', 'Amount'])
+        self.assertCountEqual(rows[header + 1:], [
+            ['SO-SR1', 'Rahim Traders', '2026-03-02', '250.50'],
+            ['IS-SR2', 'Anonymous', '2026-03-03', '99.50'],
+        ])
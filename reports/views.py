@@ -1,20 +1,24 @@
 from django.shortcuts import render
 from django.views.generic import ListView
 from django.http import HttpResponse
+from django.conf import settings
 from django.template.loader import get_template
 from django.utils import timezone
-from django.db.models import Sum, Count
+from django.db.models import Sum, Count, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import ValidationError
 from django.db import DatabaseError
 import logging
+import threading
 from decimal import Decimal
 from datetime import timedelta
 import csv
 from django.utils.dateparse import parse_date
 
 from .models import ReportLog
+from .services import build_financial_flow_context
 from sales.models import SalesOrder, SalesOrderItem
 from purchases.models import PurchaseOrder, GoodsReceipt
 from stock.models import Product
@@ -25,6 +29,30 @@ from core.utils import get_company_info
 from datetime import timedelta
 
 
+def _parse_range(request, default_days=30, default_start=None):
+    """
+    Parse start_date/end_date from the query string.
+    Missing or invalid dates fall back to the last `default_days` days,
+    or to `default_start` for the start date when it is given.
+    """
+    now = timezone.now()
+    end_date = _parse_date_param(request.GET.get('end_date')) or now.date()
+    start_date = (
+        _parse_date_param(request.GET.get('start_date'))
+        or default_start
+        or (now - timedelta(days=default_days)).date()
+    )
+    return start_date, end_date
+
+
+def _parse_date_param(value):
+    """Parse a YYYY-MM-DD query value, returning None if missing or invalid"""
+    try:
+        return parse_date(value or '')
+    except ValueError:
+        return None
+
+
 # ==================== REPORTS ====================
 
 class TopSellingProductsReportView(LoginRequiredMixin, ListView):
@@ -41,19 +69,7 @@ class TopSellingProductsReportView(LoginRequiredMixin, ListView):
         context = super().get_context_data(**kwargs)
         
         # Get date range from request
-        start_date_str = self.request.GET.get('start_date')
-        end_date_str = self.request.GET.get('end_date')
-        
-        # Default to last 30 days if no dates provided
-        if start_date_str:
-            start_date = parse_date(start_date_str)
-        else:
-            start_date = (timezone.now() - timedelta(days=30)).date()
-            
-        if end_date_str:
-            end_date = parse_date(end_date_str)
-        else:
-            end_date = timezone.now().date()
+        start_date, end_date = _parse_range(self.request)
         
         # Get sales orders in date range (only delivered orders)
         sales_orders = SalesOrder.objects.filter(
@@ -148,18 +164,7 @@ class LabourCostReportView(LoginRequiredMixin, ListView):
     context_object_name = 'orders'
     
     def get_queryset(self):
-        start_date_str = self.request.GET.get('start_date')
-        end_date_str = self.request.GET.get('end_date')
-        
-        if start_date_str:
-            start_date = parse_date(start_date_str)
-        else:
-            start_date = (timezone.now() - timedelta(days=30)).date()
-        
-        if end_date_str:
-            end_date = parse_date(end_date_str)
-        else:
-            end_date = timezone.now().date()
+        start_date, end_date = _parse_range(self.request)
         
         qs = SalesOrder.objects.filter(
             order_date__range=[start_date, end_date]
@@ -171,18 +176,8 @@ class LabourCostReportView(LoginRequiredMixin, ListView):
         from django.db.models import Sum
         
         context = super().get_context_data(**kwargs)
-        start_date_str = self.request.GET.get('start_date')
-        end_date_str = self.request.GET.get('end_date')
-        
         # defaults used in queryset
-        if start_date_str:
-            start_date = parse_date(start_date_str)
-        else:
-            start_date = (timezone.now() - timedelta(days=30)).date()
-        if end_date_str:
-            end_date = parse_date(end_date_str)
-        else:
-            end_date = timezone.now().date()
+        start_date, end_date = _parse_range(self.request)
         
         context['start_date'] = start_date.strftime('%Y-%m-%d')
         context['end_date'] = end_date.strftime('%Y-%m-%d')
@@ -200,18 +195,7 @@ class TransportationCostReportView(LoginRequiredMixin, ListView):
     context_object_name = 'orders'
     
     def get_queryset(self):
-        start_date_str = self.request.GET.get('start_date')
-        end_date_str = self.request.GET.get('end_date')
-        
-        if start_date_str:
-            start_date = parse_date(start_date_str)
-        else:
-            start_date = (timezone.now() - timedelta(days=30)).date()
-        
-        if end_date_str:
-            end_date = parse_date(end_date_str)
-        else:
-            end_date = timezone.now().date()
+        start_date, end_date = _parse_range(self.request)
         
         qs = SalesOrder.objects.filter(
             order_date__range=[start_date, end_date]
@@ -223,18 +207,8 @@ class TransportationCostReportView(LoginRequiredMixin, ListView):
         from django.db.models import Sum
         
         context = super().get_context_data(**kwargs)
-        start_date_str = self.request.GET.get('start_date')
-        end_date_str = self.request.GET.get('end_date')
-        
         # defaults used in queryset
-        if start_date_str:
-            start_date = parse_date(start_date_str)
-        else:
-            start_date = (timezone.now() - timedelta(days=30)).date()
-        if end_date_str:
-            end_date = parse_date(end_date_str)
-        else:
-            end_date = timezone.now().date()
+        start_date, end_date = _parse_range(self.request)
         
         context['start_date'] = start_date.strftime('%Y-%m-%d')
         context['end_date'] = end_date.strftime('%Y-%m-%d')
@@ -258,13 +232,8 @@ class TopSellingCustomersReportView(LoginRequiredMixin, ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Get date range from request
-        start_date_str = self.request.GET.get('start_date')
-        end_date_str = self.request.GET.get('end_date')
-        
-        # Default to last 30 days if no dates provided
-        start_date = parse_date(start_date_str) if start_date_str else (timezone.now() - timedelta(days=30)).date()
-        end_date = parse_date(end_date_str) if end_date_str else timezone.now().date()
+        # Get date range from request (defaults to last 30 days)
+        start_date, end_date = _parse_range(self.request)
         
         # Delivered sales orders in range
         sales_orders = SalesOrder.objects.filter(
@@ -348,19 +317,7 @@ class AccountsReceivableReportView(LoginRequiredMixin, ListView):
         context = super().get_context_data(**kwargs)
         
         # Get date range from request
-        start_date_str = self.request.GET.get('start_date')
-        end_date_str = self.request.GET.get('end_date')
-        
-        # Default to last 30 days if no dates provided
-        if start_date_str:
-            start_date = parse_date(start_date_str)
-        else:
-            start_date = (timezone.now() - timedelta(days=30)).date()
-            
-        if end_date_str:
-            end_date = parse_date(end_date_str)
-        else:
-            end_date = timezone.now().date()
+        start_date, end_date = _parse_range(self.request)
         
         # Get customers with receivables
         customers = self.get_queryset()
@@ -451,19 +408,16 @@ class ProfitLossReportView(LoginRequiredMixin, ListView):
                 unit_cost = item.product.cost_price or Decimal('0')
                 cost_of_goods_sold += (unit_cost * item.quantity)
             
-            # Operating Expenses
-            operating_expenses = Expense.objects.filter(
-                expense_date__range=[start_date, end_date]
-            ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-            
-            # Expenses by Category with percentages
-            expenses_by_category = []
-            raw_expenses = Expense.objects.filter(
+            # Expenses by Category; operating expenses are the sum of the same rows
+            raw_expenses = list(Expense.objects.filter(
                 expense_date__range=[start_date, end_date]
             ).values('category__name').annotate(
                 total=Sum('amount')
-            ).order_by('-total')
+            ).order_by('-total'))
+            operating_expenses = sum((e['total'] for e in raw_expenses), Decimal('0'))
             
+            # Expenses by Category with percentages
+            expenses_by_category = []
             for expense in raw_expenses:
                 expense_dict = dict(expense)
                 expense_dict['percentage'] = (expense['total'] / sales_revenue * 100) if sales_revenue > 0 else 0
@@ -576,80 +530,28 @@ class FinancialFlowReportView(LoginRequiredMixin, ListView):
     def get_queryset(self):
         return []
 
-    def _get_date_range(self):
-        start_date_str = self.request.GET.get('start_date')
-        end_date_str = self.request.GET.get('end_date')
-
-        # Default to last 30 days
-        start_date = parse_date(start_date_str) if start_date_str else (timezone.now() - timedelta(days=30)).date()
-        end_date = parse_date(end_date_str) if end_date_str else timezone.now().date()
-        return start_date, end_date
-
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        start_date, end_date = self._get_date_range()
-
-        # Inflow: Cash/Bank received from customers (CustomerLedger with transaction_type='payment')
-        from datetime import datetime as dt
-        start_datetime = timezone.make_aware(dt.combine(start_date, dt.min.time()))
-        end_datetime = timezone.make_aware(dt.combine(end_date, dt.max.time()))
-        
-        customer_payments_qs = CustomerLedger.objects.filter(
-            transaction_type='payment',
-            transaction_date__range=[start_datetime, end_datetime]
-        ).select_related('customer')
-
-        # Calculate total inflow from customer payments
-        total_inflow = customer_payments_qs.aggregate(total=Sum('amount'))['total'] or Decimal('0')
-        
-        inflow_by_customer = customer_payments_qs.values('customer__name').annotate(
-            total=Sum('amount'),
-            payments=Count('id')
-        ).order_by('-total')
-
-        # Outflow: Cash/Bank paid to suppliers (SupplierLedger with transaction_type='payment')
-        supplier_payments_qs = SupplierLedger.objects.filter(
-            transaction_type='payment',
-            transaction_date__range=[start_datetime, end_datetime]
-        ).select_related('supplier')
+        start_date, end_date = _parse_range(self.request)
+        context.update(build_financial_flow_context(start_date, end_date))
+        context.update(get_company_info())
+        return context
 
-        # Calculate total outflow to suppliers from original queryset
-        total_outflow_suppliers = supplier_payments_qs.aggregate(total=Sum('amount'))['total'] or Decimal('0')
-        
-        outflow_by_supplier = supplier_payments_qs.values('supplier__name').annotate(
-            total=Sum('amount'),
-            payments=Count('id')
-        ).order_by('-total')
 
-        # Expenses by title (only paid expenses)
-        expenses_qs = Expense.objects.filter(
-            status='paid',
-            expense_date__range=[start_date, end_date]
-        )
-        
-        # Calculate total expenses from original queryset
-        total_expenses = expenses_qs.aggregate(total=Sum('amount'))['total'] or Decimal('0')
-        
-        expenses_by_title = expenses_qs.values('title').annotate(
-            total=Sum('amount'),
-            count=Count('id')
-        ).order_by('-total')
+_FONT_CONFIGS = threading.local()
 
-        net_flow = total_inflow - (total_outflow_suppliers + total_expenses)
 
-        context.update({
-            'start_date': start_date,
-            'end_date': end_date,
-            'inflow_by_customer': inflow_by_customer,
-            'outflow_by_supplier': outflow_by_supplier,
-            'expenses_by_title': expenses_by_title,
-            'total_inflow': total_inflow,
-            'total_outflow_suppliers': total_outflow_suppliers,
-            'total_expenses': total_expenses,
-            'net_flow': net_flow,
-            **get_company_info(),
-        })
-        return context
+def _get_font_config():
+    """
+    Return this thread's WeasyPrint FontConfiguration, reused across its PDF renders.
+    Kept per thread rather than shared: it wraps a fontconfig/Pango font map that
+    renders add @font-face fonts to, which is not safe for concurrent renders.
+    """
+    font_config = getattr(_FONT_CONFIGS, 'font_config', None)
+    if font_config is None:
+        from weasyprint.text.fonts import FontConfiguration
+        font_config = _FONT_CONFIGS.font_config = FontConfiguration()
+    return font_config
 
 
 @login_required
@@ -657,91 +559,12 @@ def download_financial_flow_pdf(request):
     """
     Download the financial inflow/outflow report as a PDF file.
     """
-    from django.template.loader import get_template
-    from core.utils import get_company_info
-    
-    start_date_str = request.GET.get('start_date')
-    end_date_str = request.GET.get('end_date')
-
-    # Parse dates with better error handling
-    try:
-        start_date = parse_date(start_date_str) if start_date_str else (timezone.now() - timedelta(days=30)).date()
-        end_date = parse_date(end_date_str) if end_date_str else timezone.now().date()
-        
-        # Validate dates
-        if start_date is None:
-            start_date = (timezone.now() - timedelta(days=30)).date()
-        if end_date is None:
-            end_date = timezone.now().date()
-    except (ValueError, TypeError):
-        # Fallback to default dates if parsing fails
-        start_date = (timezone.now() - timedelta(days=30)).date()
-        end_date = timezone.now().date()
-
-    # Convert dates to datetime for ledger queries
-    from datetime import datetime as dt
-    try:
-        start_datetime = timezone.make_aware(dt.combine(start_date, dt.min.time()))
-        end_datetime = timezone.make_aware(dt.combine(end_date, dt.max.time()))
-    except (ValueError, TypeError) as e:
-        # If date conversion fails, redirect back with error
-        from django.contrib import messages
-        from django.shortcuts import redirect
-        messages.error(request, f"Invalid date format. Please try again.")
-        return redirect('reports:financial_flow')
-
-    # Inflow: Cash/Bank received from customers
-    customer_payments_qs = CustomerLedger.objects.filter(
-        transaction_type='payment',
-        transaction_date__range=[start_datetime, end_datetime]
-    ).select_related('customer')
-
-    total_inflow = customer_payments_qs.aggregate(total=Sum('amount'))['total'] or Decimal('0')
-    
-    inflow_by_customer = customer_payments_qs.values('customer__name').annotate(
-        total=Sum('amount'),
-        payments=Count('id')
-    ).order_by('-total')
-
-    # Outflow: Cash/Bank paid to suppliers
-    supplier_payments_qs = SupplierLedger.objects.filter(
-        transaction_type='payment',
-        transaction_date__range=[start_datetime, end_datetime]
-    ).select_related('supplier')
-
-    total_outflow_suppliers = supplier_payments_qs.aggregate(total=Sum('amount'))['total'] or Decimal('0')
-    
-    outflow_by_supplier = supplier_payments_qs.values('supplier__name').annotate(
-        total=Sum('amount'),
-        payments=Count('id')
-    ).order_by('-total')
-
-    # Expenses by title (only paid expenses)
-    expenses_qs = Expense.objects.filter(
-        status='paid',
-        expense_date__range=[start_date, end_date]
-    )
-    
-    total_expenses = expenses_qs.aggregate(total=Sum('amount'))['total'] or Decimal('0')
-    
-    expenses_by_title = expenses_qs.values('title').annotate(
-        total=Sum('amount'),
-        count=Count('id')
-    ).order_by('-total')
-
-    net_flow = total_inflow - (total_outflow_suppliers + total_expenses)
+    # Invalid or missing dates fall back to the last 30 days
+    start_date, end_date = _parse_range(request)
 
     template = get_template('reports/financial_flow_pdf.html')
     context = {
-        'start_date': start_date,
-        'end_date': end_date,
-        'inflow_by_customer': inflow_by_customer,
-        'outflow_by_supplier': outflow_by_supplier,
-        'expenses_by_title': expenses_by_title,
-        'total_inflow': total_inflow,
-        'total_outflow_suppliers': total_outflow_suppliers,
-        'total_expenses': total_expenses,
-        'net_flow': net_flow,
+        **build_financial_flow_context(start_date, end_date),
         **get_company_info(),
     }
     html = template.render(context)
@@ -749,13 +572,15 @@ def download_financial_flow_pdf(request):
     # Try to generate PDF using weasyprint, fallback to HTML if not available
     try:
         from weasyprint import HTML
-        from io import BytesIO
-        
-        pdf_file = BytesIO()
-        HTML(string=html).write_pdf(pdf_file)
-        pdf_file.seek(0)
-        
-        response = HttpResponse(pdf_file.read(), content_type='application/pdf')
+
+        # write_pdf() without a target returns the bytes directly
+        pdf_bytes = HTML(string=html, base_url=str(settings.BASE_DIR)).write_pdf(
+            font_config=_get_font_config(),
+            presentational_hints=True,
+            optimize_images=True,
+        )
+
+        response = HttpResponse(pdf_bytes, content_type='application/pdf')
         response['Content-Disposition'] = f'attachment; filename="financial_flow_report_{start_date}_to_{end_date}.pdf"'
         return response
     except ImportError:
@@ -779,24 +604,13 @@ def download_financial_flow_pdf(request):
 @login_required
 def download_sales_report_csv(request):
     """Download Sales Report as CSV"""
-    start_date_str = request.GET.get('start_date')
-    end_date_str = request.GET.get('end_date')
-    
-    if start_date_str:
-        start_date = parse_date(start_date_str)
-    else:
-        start_date = (timezone.now() - timedelta(days=30)).date()
-        
-    if end_date_str:
-        end_date = parse_date(end_date_str)
-    else:
-        end_date = timezone.now().date()
+    start_date, end_date = _parse_range(request)
     
     # Get sales orders
     orders = SalesOrder.objects.filter(
         order_date__range=[start_date, end_date],
         status='delivered'
-    ).select_related('customer')
+    )
     
     response = HttpResponse(content_type='text/csv')
     response['Content-Disposition'] = f'attachment; filename="sales_report_{start_date}_to_{end_date}.csv"'
@@ -808,22 +622,20 @@ def download_sales_report_csv(request):
     writer.writerow([f'Period: {start_date} to {end_date}'])
     writer.writerow([])
     
-    # Summary
-    total_sales = orders.aggregate(total=Sum('total_amount'))['total'] or 0
-    writer.writerow(['Total Sales', total_sales])
-    writer.writerow(['Total Orders', orders.count()])
+    # Summary (total and count in one query)
+    summary = orders.aggregate(total=Sum('total_amount'), count=Count('id'))
+    writer.writerow(['Total Sales', (summary['total'] or Decimal('0')).quantize(Decimal('0.01'))])
+    writer.writerow(['Total Orders', summary['count']])
     writer.writerow([])
     
-    # Orders
+    # Orders - stream plain tuples straight into the writer
     writer.writerow(['Order Number', 'Customer', 'Date', 'Amount'])
-    for order in orders:
-        customer_name = order.customer.name if order.customer else 'Anonymous'
-        writer.writerow([
-            order.order_number,
-            customer_name,
-            order.order_date,
-            order.total_amount
-        ])
+    writer.writerows(orders.values_list(
+        'order_number',
+        Coalesce('customer__name', Value('Anonymous')),
+        'order_date',
+        'total_amount',
+    ).iterator(chunk_size=5000))
     
     return response
 
@@ -831,43 +643,17 @@ def download_sales_report_csv(request):
 @login_required
 def download_top_products_csv(request):
     """Download Top Selling Products Report as CSV"""
-    start_date_str = request.GET.get('start_date')
-    end_date_str = request.GET.get('end_date')
-    
-    if start_date_str:
-        start_date = parse_date(start_date_str)
-    else:
-        start_date = (timezone.now() - timedelta(days=30)).date()
-        
-    if end_date_str:
-        end_date = parse_date(end_date_str)
-    else:
-        end_date = timezone.now().date()
-    
-    # Get sales orders
-    orders = SalesOrder.objects.filter(
-        order_date__range=[start_date, end_date],
-        status='delivered'
-    ).prefetch_related('items__product')
-    
-    # Calculate product sales
-    product_sales = {}
-    for order in orders:
-        for item in order.items.all():
-            product_name = item.product.name
-            if product_name in product_sales:
-                product_sales[product_name]['quantity'] += float(item.quantity)
-                product_sales[product_name]['value'] += float(item.total_price)
-                product_sales[product_name]['orders'] += 1
-            else:
-                product_sales[product_name] = {
-                    'quantity': float(item.quantity),
-                    'value': float(item.total_price),
-                    'orders': 1
-                }
-    
-    # Sort by value
-    sorted_products = sorted(product_sales.items(), key=lambda x: x[1]['value'], reverse=True)
+    start_date, end_date = _parse_range(request)
+    
+    # Aggregate delivered line items per product in SQL, sorted by value
+    product_sales = SalesOrderItem.objects.filter(
+        sales_order__order_date__range=[start_date, end_date],
+        sales_order__status='delivered'
+    ).values('product__name').annotate(
+        quantity=Sum('quantity'),
+        value=Sum('total_price'),
+        orders=Count('id'),
+    ).order_by('-value')
     
     response = HttpResponse(content_type='text/csv')
     response['Content-Disposition'] = f'attachment; filename="top_products_{start_date}_to_{end_date}.csv"'
@@ -881,13 +667,12 @@ def download_top_products_csv(request):
     
     # Products
     writer.writerow(['Product Name', 'Total Quantity', 'Total Value', 'Orders'])
-    for product_name, data in sorted_products:
-        writer.writerow([
-            product_name,
-            data['quantity'],
-            data['value'],
-            data['orders']
-        ])
+    # Aggregated decimals come back unquantized on some backends, so round to cents
+    cent = Decimal('0.01')
+    writer.writerows(
+        (name, quantity.quantize(cent), value.quantize(cent), orders)
+        for name, quantity, value, orders in product_sales.values_list('product__name', 'quantity', 'value', 'orders')
+    )
     
     return response
 
@@ -895,18 +680,7 @@ def download_top_products_csv(request):
 @login_required
 def download_top_customers_csv(request):
     """Download Top Selling Customers Report as CSV"""
-    start_date_str = request.GET.get('start_date')
-    end_date_str = request.GET.get('end_date')
-    
-    if start_date_str:
-        start_date = parse_date(start_date_str)
-    else:
-        start_date = (timezone.now() - timedelta(days=30)).date()
-        
-    if end_date_str:
-        end_date = parse_date(end_date_str)
-    else:
-        end_date = timezone.now().date()
+    start_date, end_date = _parse_range(request)
     
     # Get sales orders
     orders = SalesOrder.objects.filter(
@@ -983,18 +757,10 @@ def download_receivables_csv(request):
 @login_required
 def download_profit_loss_csv(request):
     """Download Profit & Loss report as CSV"""
-    start_date_str = request.GET.get('start_date')
-    end_date_str = request.GET.get('end_date')
-    
-    if start_date_str:
-        start_date = parse_date(start_date_str)
-    else:
-        start_date = timezone.now().date().replace(day=1)
-        
-    if end_date_str:
-        end_date = parse_date(end_date_str)
-    else:
-        end_date = timezone.now().date()
+    # Default to the current month
+    start_date, end_date = _parse_range(
+        request, default_start=timezone.now().date().replace(day=1)
+    )
     
     # Calculate P&L data
     sales_revenue = SalesOrder.objects.filter(
@@ -1008,20 +774,17 @@ def download_profit_loss_csv(request):
         receipt_date__range=[start_date, end_date]
     ).aggregate(total=Sum('total_amount'))['total'] or Decimal('0')
     
-    operating_expenses = Expense.objects.filter(
+    # Expenses by category; the grand total is summed from the same rows
+    expenses_by_category = list(Expense.objects.filter(
         expense_date__range=[start_date, end_date]
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
+    ).values('category__name').annotate(
+        total=Sum('amount')
+    ).order_by('-total'))
+    operating_expenses = sum((e['total'] for e in expenses_by_category), Decimal('0'))
     
     gross_profit = sales_revenue - cost_of_goods_sold
     net_profit = gross_profit - operating_expenses
     
-    # Expenses by category
-    expenses_by_category = Expense.objects.filter(
-        expense_date__range=[start_date, end_date]
-    ).values('category__name').annotate(
-        total=Sum('amount')
-    ).order_by('-total')
-    
     response = HttpResponse(content_type='text/csv')
     response['Content-Disposition'] = f'attachment; filename="profit_loss_report_{start_date}_to_{end_date}.csv"'
     
@@ -1,37 +1,87 @@
 from django import forms
+from django.db import transaction
 from django.forms import inlineformset_factory
 from decimal import Decimal, ROUND_HALF_UP
 from .models import SalesOrder, SalesOrderItem
 from customers.models import Customer
-from stock.models import Product, ProductCategory, ProductBrand, Warehouse
+from stock.models import Product, ProductCategory, ProductBrand, Warehouse, get_realtime_quantities
+
+
+# Rounding quanta by number of decimal places (0 -> 1, 2 -> 0.01, ...)
+_QUANTA = {n: Decimal(1).scaleb(-n) for n in range(0, 7)}
+
+# Quantum for rounding money and quantities to 2 decimal places
+_Q2 = _QUANTA[2]
+
+# Zero default for money fields
+_D0 = Decimal('0')
+
+# Shared widget attrs; widgets copy attrs, so these are never mutated
+_MONEY_WIDGET_ATTRS = {'class': 'form-control', 'step': '0.01', 'min': '0', 'placeholder': '0.00'}
+_ONCHANGE_TOGGLE = {'onchange': 'toggleCustomerFields()'}
+
+# Statuses offered on the sales order form
+_STATUS_CHOICES = (
+    ('order', 'Order'),
+    ('delivered', 'Delivered'),
+    ('cancel', 'Cancel'),
+)
+
+
+def _active_customers():
+    return Customer.objects.filter(is_active=True)
+
+
+def _active_products():
+    return Product.objects.filter(is_active=True).select_related('category', 'brand')
+
+
+def _active_warehouses():
+    return Warehouse.objects.filter(is_active=True).order_by('name')
 
 
 class RoundedDecimalField(forms.DecimalField):
-    """Custom DecimalField that rounds input to 2 decimal places"""
+    """Custom DecimalField that rounds input half-up to `places` decimal places (2 by default)"""
+    
+    def __init__(self, *args, places=2, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.quantum = _QUANTA[places]
     
     def to_python(self, value):
         if value is None or value == '':
             return None
         
-        # Convert to Decimal and round to 2 decimal places
-        decimal_value = Decimal(str(value))
-        rounded_value = decimal_value.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-        
-        return rounded_value
+        # Decimals and ints convert exactly; only other input needs the str() round-trip
+        if isinstance(value, Decimal):
+            return value.quantize(self.quantum, rounding=ROUND_HALF_UP)
+        if isinstance(value, int):
+            return Decimal(value).quantize(self.quantum, rounding=ROUND_HALF_UP)
+        return Decimal(str(value)).quantize(self.quantum, rounding=ROUND_HALF_UP)
 
 
-class SalesOrderForm(forms.ModelForm):
-    """Form for creating and editing sales orders"""
-    
-    delivery_charges = RoundedDecimalField(
+def _money_field(label, html_id):
+    """Optional, non-negative money amount rounded to 2 decimal places"""
+    return RoundedDecimalField(
         max_digits=15,
         decimal_places=2,
-        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01', 'min': '0', 'placeholder': '0.00', 'id': 'id_delivery_charges'}),
-        label='Total Delivery Charge',
+        widget=forms.NumberInput(attrs={**_MONEY_WIDGET_ATTRS, 'id': html_id}),
+        label=label,
         required=False,
-        min_value=Decimal('0'),  # Explicitly allow 0
-        max_value=None  # No maximum limit
+        min_value=_D0,  # Explicitly allow 0
     )
+
+
+def _require_positive(value, name):
+    """Reject zero or negative amounts; an empty value is left to the required check"""
+    if value is not None and value <= 0:
+        raise forms.ValidationError(f'{name} must be greater than 0.')
+    return value
+
+
+class SalesOrderForm(forms.ModelForm):
+    """Form for creating and editing sales orders"""
+    
+    delivery_charges = _money_field('Total Delivery Charge', 'id_delivery_charges')
     
     def clean_delivery_charges(self):
         """Allow 0 as a valid value for delivery charges"""
@@ -51,25 +101,9 @@ class SalesOrderForm(forms.ModelForm):
         # Return the value (including 0 if user set it to 0)
         return value
     
-    discount_amount = RoundedDecimalField(
-        max_digits=15,
-        decimal_places=2,
-        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01', 'min': '0', 'placeholder': '0.00', 'id': 'id_discount_amount'}),
-        label='Discount Amount',
-        required=False,
-        min_value=Decimal('0'),
-        max_value=None
-    )
+    discount_amount = _money_field('Discount Amount', 'id_discount_amount')
     
-    customer_deposit = RoundedDecimalField(
-        max_digits=15,
-        decimal_places=2,
-        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01', 'min': '0', 'placeholder': '0.00', 'id': 'id_customer_deposit'}),
-        label='Customer Deposit',
-        required=False,
-        min_value=Decimal('0'),
-        max_value=None
-    )
+    customer_deposit = _money_field('Customer Deposit', 'id_customer_deposit')
     
     class Meta:
         model = SalesOrder
@@ -97,17 +131,11 @@ class SalesOrderForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields['customer'].queryset = Customer.objects.filter(is_active=True)
-        self.fields['status'].choices = [
-            ('order', 'Order'),
-            ('delivered', 'Delivered'),
-            ('cancel', 'Cancel'),
-        ]
+        self.fields['customer'].queryset = _active_customers()
+        self.fields['status'].choices = _STATUS_CHOICES
         
         # Add JavaScript for conditional field display
-        self.fields['sales_type'].widget.attrs.update({
-            'onchange': 'toggleCustomerFields()'
-        })
+        self.fields['sales_type'].widget.attrs.update(_ONCHANGE_TOGGLE)
         
         # Set default status and sales_type
         if not self.instance.pk:
@@ -119,9 +147,9 @@ class SalesOrderForm(forms.ModelForm):
         else:
             # For existing orders, always show the saved delivery_charges from database
             # Don't recalculate - respect the saved value (even if 0)
-            self.fields['delivery_charges'].initial = self.instance.delivery_charges or Decimal('0')
-            self.fields['discount_amount'].initial = self.instance.discount_amount or Decimal('0')
-            self.fields['customer_deposit'].initial = self.instance.customer_deposit or Decimal('0')
+            self.fields['delivery_charges'].initial = self.instance.delivery_charges or _D0
+            self.fields['discount_amount'].initial = self.instance.discount_amount or _D0
+            self.fields['customer_deposit'].initial = self.instance.customer_deposit or _D0
     
     def clean(self):
         cleaned_data = super().clean()
@@ -228,8 +256,8 @@ class SalesOrderItemForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields['product'].queryset = Product.objects.filter(is_active=True).select_related('category', 'brand')
-        self.fields['warehouse'].queryset = Warehouse.objects.filter(is_active=True).order_by('name')
+        self.fields['product'].queryset = _active_products()
+        self.fields['warehouse'].queryset = _active_warehouses()
         self.fields['warehouse'].required = True
         
         # Add data attributes for JavaScript filtering
@@ -239,26 +267,19 @@ class SalesOrderItemForm(forms.ModelForm):
             })
 
     def clean_quantity(self):
-        quantity = self.cleaned_data.get('quantity')
-        if quantity is not None:
-            if quantity <= 0:
-                raise forms.ValidationError('Quantity must be greater than 0.')
-            # Round to 2 decimal places
-            quantity = round(quantity, 2)
-        return quantity
+        # Already rounded to 2 decimal places by RoundedDecimalField
+        return _require_positive(self.cleaned_data.get('quantity'), 'Quantity')
 
     def clean_unit_price(self):
-        unit_price = self.cleaned_data.get('unit_price')
-        if unit_price is not None:
-            if unit_price <= 0:
-                raise forms.ValidationError('Unit price must be greater than 0.')
-            # Round to 2 decimal places
-            unit_price = round(unit_price, 2)
-        return unit_price
+        return _require_positive(self.cleaned_data.get('unit_price'), 'Unit price')
 
     def clean(self):
         cleaned_data = super().clean()
         
+        # Rows marked for deletion are discarded by the formset, skip validating them
+        if cleaned_data.get('DELETE'):
+            return cleaned_data
+        
         # If product is not selected, skip validation (empty form)
         product = cleaned_data.get('product')
         if not product:
@@ -267,32 +288,20 @@ class SalesOrderItemForm(forms.ModelForm):
             return cleaned_data
         
         warehouse = cleaned_data.get('warehouse')
-        quantity = cleaned_data.get('quantity', 0)
-        unit_price = cleaned_data.get('unit_price', 0)
+        quantity = cleaned_data.get('quantity') or 0
+        unit_price = cleaned_data.get('unit_price') or 0
         
-        # Validate warehouse is selected when product is selected
-        if product and not warehouse:
+        # Validate warehouse, quantity and price now that a product is selected
+        if not warehouse:
             raise forms.ValidationError('Warehouse must be selected when product is selected.')
-        
-        # Validate quantity and price if product is selected
-        if product:
-            if not quantity or quantity <= 0:
-                raise forms.ValidationError('Quantity must be greater than 0 when product is selected.')
-            if not unit_price or unit_price <= 0:
-                raise forms.ValidationError('Unit price must be greater than 0 when product is selected.')
-            
-            # Validate available stock in warehouse
-            if warehouse:
-                available_qty = product.get_realtime_quantity(warehouse=warehouse)
-                if quantity > available_qty:
-                    raise forms.ValidationError(
-                        f'Insufficient stock in {warehouse.name}. Available: {available_qty}, Requested: {quantity}'
-                    )
+        if quantity <= 0:
+            raise forms.ValidationError('Quantity must be greater than 0 when product is selected.')
+        if unit_price <= 0:
+            raise forms.ValidationError('Unit price must be greater than 0 when product is selected.')
+        # Available stock is validated for all rows at once by the formset
         
         # Calculate total price and round to 2 decimal places
-        if quantity and unit_price:
-            total = quantity * unit_price
-            cleaned_data['total_price'] = round(total, 2)
+        cleaned_data['total_price'] = (quantity * unit_price).quantize(_Q2, rounding=ROUND_HALF_UP)
         
         return cleaned_data
 
@@ -301,7 +310,7 @@ class SalesOrderItemForm(forms.ModelForm):
         # Calculate total price and round to 2 decimal places
         quantity = self.cleaned_data.get('quantity', 0)
         unit_price = self.cleaned_data.get('unit_price', 0)
-        instance.total_price = round(quantity * unit_price, 2)
+        instance.total_price = (quantity * unit_price).quantize(_Q2, rounding=ROUND_HALF_UP)
         
         if commit:
             instance.save()
@@ -310,34 +319,125 @@ class SalesOrderItemForm(forms.ModelForm):
 
 # Override formset to handle empty forms
 class BaseSalesOrderItemFormSet(forms.BaseInlineFormSet):
+    # Dropdowns whose options are fetched once and shared by every row,
+    # with the only columns their option labels need
+    shared_choice_fields = {
+        'product': ('id', 'name', 'category__name', 'brand__name'),
+        'warehouse': ('id', 'name'),
+    }
+
+    def __init__(self, *args, **kwargs):
+        self._shared_choices = {}
+        super().__init__(*args, **kwargs)
+
+    def _construct_form(self, i, **kwargs):
+        form = super()._construct_form(i, **kwargs)
+        for name, columns in self.shared_choice_fields.items():
+            field = form.fields[name]
+            if name not in self._shared_choices:
+                # Narrow only the options query; the field keeps full rows for validation
+                choices = field.iterator(field)
+                choices.queryset = field.queryset.only(*columns)
+                # iter() avoids the extra COUNT query list() triggers via len()
+                self._shared_choices[name] = list(iter(choices))
+            # Rendering reads the cached options; validation still uses the queryset
+            field.choices = self._shared_choices[name]
+        return form
+
     def clean(self):
         """Allow empty forms - they will be ignored"""
         # Don't validate empty forms
-        return super().clean()
-
-# Inline formset for sales order items
-SalesOrderItemFormSet = inlineformset_factory(
-    SalesOrder,
-    SalesOrderItem,
-    form=SalesOrderItemForm,
-    formset=BaseSalesOrderItemFormSet,
-    fields=['product', 'warehouse', 'quantity', 'unit_price', 'total_price', 'product_note'],
-    extra=0,  # No extra forms by default
-    can_delete=True,
-    min_num=0,  # Allow zero items initially
-    validate_min=False,
-)
+        super().clean()
+        self._validate_stock()
+    
+    def save_new_objects(self, commit=True):
+        """Insert all new item rows with a single bulk query"""
+        if not commit:
+            return super().save_new_objects(commit=False)
+        
+        self.new_objects = []
+        for form in self.extra_forms:
+            if not form.has_changed():
+                continue
+            if self.can_delete and self._should_delete_form(form):
+                continue
+            # Sets the order and total_price without saving
+            self.new_objects.append(self.save_new(form, commit=False))
+        # SalesOrderItem has no save() override or signals for bulk_create to skip
+        SalesOrderItem.objects.bulk_create(self.new_objects, batch_size=500)
+        return self.new_objects
 
-# Custom formset class to handle creation without instance
-class SalesOrderItemFormSetCustom(SalesOrderItemFormSet):
-    def __init__(self, *args, **kwargs):
-        # If no instance is provided, add one extra form for new orders
-        if 'instance' not in kwargs or kwargs['instance'] is None:
-            self.extra = 1
-        else:
-            # No extra forms for existing orders
-            self.extra = 0
-        super().__init__(*args, **kwargs)
+    def save_existing_objects(self, commit=True):
+        """Update changed item rows and delete removed ones with one query each"""
+        if not commit:
+            return super().save_existing_objects(commit=False)
+
+        self.changed_objects = []
+        self.deleted_objects = []
+        saved_instances = []
+        forms_to_delete = self.deleted_forms
+        for form in self.initial_forms:
+            obj = form.instance
+            if obj.pk is None:
+                continue
+            if form in forms_to_delete:
+                self.deleted_objects.append(obj)
+            elif form.has_changed():
+                self.changed_objects.append((obj, form.changed_data))
+                # Recomputes total_price without saving
+                saved_instances.append(self.save_existing(form, obj, commit=False))
+        if self.deleted_objects:
+            SalesOrderItem.objects.filter(pk__in=[obj.pk for obj in self.deleted_objects]).delete()
+        if saved_instances:
+            SalesOrderItem.objects.bulk_update(saved_instances, self.form._meta.fields, batch_size=500)
+        return saved_instances
+
+    def _validate_stock(self):
+        """Validate each row's quantity against warehouse stock with one batched lookup"""
+        rows = [
+            form for form in self.forms
+            if not form.errors and not self._should_delete_form(form)
+            and form.cleaned_data.get('product') and form.cleaned_data.get('warehouse')
+        ]
+        if not rows:
+            return
+        
+        product_ids = {form.cleaned_data['product'].pk for form in rows}
+        if not transaction.get_autocommit():
+            # Inside the order's transaction: hold these products until it commits so
+            # concurrent sales can't both pass the check against the same stock
+            list(Product.objects.select_for_update().filter(pk__in=product_ids).values_list('pk', flat=True))
+        available = get_realtime_quantities(
+            product_ids,
+            {form.cleaned_data['warehouse'].pk for form in rows},
+        )
+        for form in rows:
+            product = form.cleaned_data['product']
+            warehouse = form.cleaned_data['warehouse']
+            quantity = form.cleaned_data['quantity']
+            available_qty = available.get((product.pk, warehouse.pk), _D0)
+            if quantity > available_qty:
+                form.add_error(
+                    'quantity',
+                    f'Insufficient stock in {warehouse.name}. Available: {available_qty}, Requested: {quantity}'
+                )
+
+
+# Inline formsets for sales order items: new orders start with one blank row,
+# existing orders show only their saved items
+_ITEM_FIELDS = ['product', 'warehouse', 'quantity', 'unit_price', 'total_price', 'product_note']
+_ITEM_FORMSET_OPTIONS = {
+    'form': SalesOrderItemForm,
+    'formset': BaseSalesOrderItemFormSet,
+    'fields': _ITEM_FIELDS,
+    'can_delete': True,
+    'min_num': 0,  # Allow zero items initially
+    'validate_min': False,
+}
+
+SalesOrderItemCreateFormSet = inlineformset_factory(SalesOrder, SalesOrderItem, extra=1, **_ITEM_FORMSET_OPTIONS)
+
+SalesOrderItemFormSet = inlineformset_factory(SalesOrder, SalesOrderItem, extra=0, **_ITEM_FORMSET_OPTIONS)
 
 
 class SalesOrderSearchForm(forms.Form):
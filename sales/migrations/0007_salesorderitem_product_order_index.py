@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-15 23:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0006_order_number_sequence'),
+        ('stock', '0006_product_is_tile'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='salesorderitem',
+            name='sales_sales_product_462ddd_idx',
+        ),
+        migrations.AddIndex(
+            model_name='salesorderitem',
+            index=models.Index(fields=['product', 'sales_order'], name='sales_sales_product_979cc8_idx'),
+        ),
+    ]
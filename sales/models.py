@@ -93,8 +93,34 @@ class SalesOrderItem(models.Model):
         verbose_name_plural = "Sales Order Items"
         indexes = [
             models.Index(fields=['sales_order']),
-            models.Index(fields=['product']),
+            # Delivered quantity per product, joined to the order for its status
+            models.Index(fields=['product', 'sales_order']),
             models.Index(fields=['warehouse']),
         ]
 
 
+
+
+class OrderNumberSequence(models.Model):
+    """Last order number issued for a prefix and year, e.g. key 'SO-2026'"""
+    key = models.CharField(max_length=20, unique=True)
+    last_value = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key}: {self.last_value}"
+
+    @classmethod
+    def next_value(cls, key):
+        """
+        Reserve the next number for key. Call inside the order's transaction:
+        the row stays locked until it commits, and a rollback hands the
+        number back.
+        """
+        sequence, _ = cls.objects.select_for_update().get_or_create(key=key)
+        sequence.last_value += 1
+        sequence.save(update_fields=['last_value'])
+        return sequence.last_value
+
+    class Meta:
+        verbose_name = "Order Number Sequence"
+        verbose_name_plural = "Order Number Sequences"
@@ -3,16 +3,21 @@ Test cases for the Sales module
 Tests all sales functionality including regular sales, instant sales, and inventory management
 """
 
+from django.db import connection
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.utils import timezone
 from decimal import Decimal
 from datetime import date, timedelta
+from unittest import mock
 
 from sales.models import SalesOrder, SalesOrderItem
-from customers.models import Customer
-from stock.models import Product, ProductCategory, ProductBrand
+from sales.forms import SalesOrderItemForm, SalesOrderItemFormSet
+from customers.models import Customer, CustomerLedger
+from stock.models import Product, ProductCategory, ProductBrand, UnitType
+from stock.testing import StockedProductMixin
 from suppliers.models import Supplier
 
 
@@ -785,3 +790,828 @@ class SalesURLTests(TestCase):
             with self.subTest(url=url_name):
                 response = self.client.get(reverse(url_name, kwargs=kwargs))
                 self.assertIn(response.status_code, [200, 302])  # 200 for invoice, 302 for redirects
+
+
+class StockedProductTestCase(StockedProductMixin, TestCase):
+    """Base for tests that sell a product with 10 units received into one warehouse"""
+    
+    def _items_data(self, *quantities, unit_price='1.00', ids=()):
+        """
+        POST data for the items formset: one row of the product per quantity,
+        the first len(ids) rows being the existing items with those ids
+        """
+        data = {
+            'items-TOTAL_FORMS': str(len(quantities)),
+            'items-INITIAL_FORMS': str(len(ids)),
+            'items-MIN_NUM_FORMS': '0',
+            'items-MAX_NUM_FORMS': '1000',
+        }
+        for i, quantity in enumerate(quantities):
+            data.update({
+                f'items-{i}-product': self.product.id,
+                f'items-{i}-warehouse': self.warehouse.id,
+                f'items-{i}-quantity': quantity,
+                f'items-{i}-unit_price': unit_price,
+            })
+        for i, item_id in enumerate(ids):
+            data[f'items-{i}-id'] = item_id
+        return data
+
+
+class SalesOrderItemFormTests(StockedProductTestCase):
+    """Test cases for SalesOrderItemForm totals"""
+    
+    def test_total_price_rounds_half_up(self):
+        """Test total price uses ROUND_HALF_UP rather than banker's rounding"""
+        form = SalesOrderItemForm(data={
+            'product': self.product.id,
+            'warehouse': self.warehouse.id,
+            'quantity': '1.5',
+            'unit_price': '1.35',  # 2.025
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data['total_price'], Decimal('2.03'))
+
+
+class SalesOrderItemFormSetTests(StockedProductTestCase):
+    """Test cases for the sales order items formset's stock validation and saving"""
+    
+    def _formset(self, *quantities, instance=None, ids=()):
+        return SalesOrderItemFormSet(self._items_data(*quantities, ids=ids), instance=instance, prefix='items')
+    
+    def test_insufficient_stock(self):
+        """Test requesting more than the warehouse holds is rejected"""
+        formset = self._formset('11')
+        self.assertFalse(formset.is_valid())
+        self.assertIn('Insufficient stock', str(formset.forms[0].errors['quantity']))
+    
+    def test_stock_checked_in_one_lookup(self):
+        """Test stock for every row is fetched with a fixed number of queries"""
+        formset = self._formset('4', '6', '10', '11')
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertFalse(formset.is_valid())
+        stock_queries = [q['sql'] for q in ctx.captured_queries if 'SUM(' in q['sql']]
+        # One grouped query for receipts and deliveries, however many rows
+        self.assertEqual(len(stock_queries), 1)
+        self.assertEqual([bool(form.errors) for form in formset.forms], [False, False, False, True])
+    
+    def test_deleted_rows_skip_stock_check(self):
+        """Test rows marked for deletion are not checked against stock"""
+        formset = self._formset('4', '11')
+        formset.data = formset.data.copy()
+        formset.data['items-1-DELETE'] = 'on'
+        self.assertTrue(formset.is_valid(), formset.errors)
+        self.assertNotIn('quantity', formset.forms[1].errors)
+    
+    def test_formset_saves_new_items_in_one_insert(self):
+        """Test new rows are inserted together with their totals computed"""
+        order = SalesOrder.objects.create(order_number='SO-BULK', order_date=date.today())
+        formset = self._formset('2', '3', instance=order)
+        self.assertTrue(formset.is_valid(), formset.errors)
+        with CaptureQueriesContext(connection) as ctx:
+            formset.save()
+        inserts = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(
+            sorted(order.items.values_list('total_price', flat=True)),
+            [Decimal('2.00'), Decimal('3.00')]
+        )
+    
+    def test_formset_updates_changed_items_in_one_query(self):
+        """Test edited rows are updated together and removed rows deleted together"""
+        order = SalesOrder.objects.create(order_number='SO-BULK', order_date=date.today())
+        items = [
+            SalesOrderItem.objects.create(
+                sales_order=order, product=self.product, warehouse=self.warehouse,
+                quantity=Decimal('1'), unit_price=Decimal('1.00'), total_price=Decimal('1.00'),
+            )
+            for _ in range(3)
+        ]
+        formset = self._formset('2', '3', '1', instance=order, ids=[item.id for item in items])
+        formset.data = formset.data.copy()
+        formset.data['items-2-DELETE'] = 'on'
+        self.assertTrue(formset.is_valid(), formset.errors)
+        with CaptureQueriesContext(connection) as ctx:
+            formset.save()
+        writes = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith(('UPDATE', 'DELETE'))]
+        self.assertEqual(len(writes), 2)
+        self.assertEqual(
+            sorted(order.items.values_list('total_price', flat=True)),
+            [Decimal('2.00'), Decimal('3.00')]
+        )
+    
+    def test_formset_fetches_dropdowns_once(self):
+        """Test product and warehouse options are queried once for all rows"""
+        formset = SalesOrderItemFormSet(prefix='items')
+        formset.extra = 3
+        # One query each for products and warehouses, however many rows
+        with self.assertNumQueries(2) as ctx:
+            html = ''.join(str(form['product']) + str(form['warehouse']) for form in formset.forms)
+        # Only the label columns are selected
+        self.assertNotIn('selling_price', ctx.captured_queries[0]['sql'])
+        self.assertNotIn('created_at', ctx.captured_queries[1]['sql'])
+        self.assertEqual(html.count('Test Product'), 3)
+        self.assertEqual(html.count('Main Warehouse'), 3)
+
+
+class SalesOrderFormViewTests(StockedProductTestCase):
+    """Test cases for the sales order and instant sale form views"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.customer = Customer.objects.create(name='Stock Customer')
+        cls.user = User.objects.create_user(username='seller', password='testpass123')
+    
+    def setUp(self):
+        self.client.force_login(self.user)
+    
+    def _order_data(self, quantity, unit_price='1.00', **fields):
+        """POST data for a regular order with one item row"""
+        data = {
+            'sales_type': 'regular',
+            'customer': self.customer.id,
+            'order_date': date.today().isoformat(),
+            'status': 'order',
+            'delivery_charges': '0',
+            'transportation_cost': '0',
+            'discount_amount': '0',
+            'customer_deposit': '0',
+            **self._items_data(quantity, unit_price=unit_price),
+        }
+        data.update(fields)
+        return data
+    
+    def _instant_sale_data(self, quantity, unit_price='1.00'):
+        """POST data for an instant sale with one item row"""
+        return {
+            'sales_type': 'instant',
+            'customer_name': 'Walk-in',
+            'order_date': date.today().isoformat(),
+            **self._items_data(quantity, unit_price=unit_price),
+        }
+    
+    def test_create_view_rolls_back_order_when_items_invalid(self):
+        """Test no order is left behind when its items fail the stock check"""
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('sales:order_create'), self._order_data('11'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Insufficient stock')
+        self.assertFalse(SalesOrder.objects.exists())
+        # The items are bound and validated once, then shown with their errors
+        self.assertEqual(len([q for q in ctx.captured_queries if 'SUM(' in q['sql']]), 1)
+    
+    def test_create_view_saves_totals_without_rewriting_order(self):
+        """Test the totals pass updates only the amount columns"""
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(
+                reverse('sales:order_create'),
+                self._order_data('4', unit_price='2.50', transportation_cost='5')
+            )
+        self.assertEqual(response.status_code, 302)
+        order = SalesOrder.objects.get()
+        self.assertEqual(order.total_amount, Decimal('15.00'))
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "sales_salesorder"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"total_amount"', updates[0])
+        self.assertNotIn('"order_number"', updates[0])
+    
+    def test_instant_sale_rejected_items_validated_once(self):
+        """Test an instant sale with too little stock saves nothing and checks its items once"""
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('sales:instant_sales'), self._instant_sale_data('11'))
+        self.assertEqual(response.status_code, 200)
+        # Shown once, on the row, rather than as the raw error dict in the message
+        self.assertContains(response, 'Insufficient stock', count=1)
+        self.assertEqual(
+            [str(message) for message in response.context['messages']],
+            ['Please fix the errors in the product selection.']
+        )
+        self.assertFalse(SalesOrder.objects.exists())
+        # One stock check for the items, reused for the error page, and one for the product list
+        self.assertEqual(len([q for q in ctx.captured_queries if 'SUM(' in q['sql']]), 2)
+    
+    def test_instant_sale_form_stock_in_one_query(self):
+        """Test the instant sale form shows product stock without a query per product"""
+        # More delivered than received: shown as no stock, as get_realtime_quantity reports it
+        oversold = Product.objects.create(name='Oversold', unit_type=self.unit_type)
+        order = SalesOrder.objects.create(order_number='SO-OVR', order_date=date.today(), status='delivered')
+        SalesOrderItem.objects.create(
+            sales_order=order, product=oversold, warehouse=self.warehouse,
+            quantity=Decimal('2'), unit_price=Decimal('1.00'), total_price=Decimal('2.00')
+        )
+        
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('sales:instant_sales'))
+        self.assertEqual(
+            {product.name: product.realtime_quantity for product in response.context['products']},
+            {'Test Product': Decimal('10'), 'Oversold': Decimal('0')}
+        )
+        
+        Product.objects.create(name='Another Product', unit_type=self.unit_type)
+        with self.assertNumQueries(len(ctx)):
+            self.client.get(reverse('sales:instant_sales'))
+    
+    def test_edits_rejected_for_items_leave_order_unchanged(self):
+        """Test an edit with an invalid item row saves none of the order's header changes"""
+        order = SalesOrder.objects.create(
+            order_number='SO-EDIT', customer=self.customer, order_date=date.today(),
+            status='order', notes='Original', created_by=self.user
+        )
+        sale = SalesOrder.objects.create(
+            order_number='IS-EDIT', sales_type='instant', customer_name='Walk-in',
+            order_date=date.today(), status='delivered', created_by=self.user
+        )
+        for edited in (order, sale):
+            SalesOrderItem.objects.create(
+                sales_order=edited, product=self.product, warehouse=self.warehouse,
+                quantity=Decimal('2'), unit_price=Decimal('1.00'), total_price=Decimal('2.00')
+            )
+        
+        data = self._order_data('11', notes='Changed', discount_amount='5', customer_deposit='3')
+        data.update(self._items_data('11', ids=(order.items.get().id,)))
+        response = self.client.post(reverse('sales:order_edit', args=[order.id]), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Insufficient stock')
+        
+        data = self._instant_sale_data('11')
+        data.update(customer_name='Changed', **self._items_data('11', ids=(sale.items.get().id,)))
+        response = self.client.post(reverse('sales:instant_sales_edit', args=[sale.id]), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Insufficient stock')
+        
+        order.refresh_from_db()
+        self.assertEqual((order.notes, order.discount_amount, order.customer_deposit), ('Original', Decimal('0'), Decimal('0')))
+        sale.refresh_from_db()
+        self.assertEqual(sale.customer_name, 'Walk-in')
+        self.assertEqual(
+            list(SalesOrderItem.objects.values_list('quantity', flat=True)), [Decimal('2'), Decimal('2')]
+        )
+        self.assertFalse(CustomerLedger.objects.exists())
+    
+    def test_edit_changes_and_removes_deposit(self):
+        """Test editing the deposit updates its ledger entry, and removing it reverses the payment"""
+        self.client.post(reverse('sales:order_create'), self._order_data('4', unit_price='2.50', customer_deposit='30'))
+        order = SalesOrder.objects.get()
+        data = self._order_data('4', unit_price='2.50')
+        data.update(self._items_data('4', unit_price='2.50', ids=(order.items.get().id,)))
+        deposits = CustomerLedger.objects.filter(reference=f'{order.order_number}-DEPOSIT', transaction_type='payment')
+        
+        data['customer_deposit'] = '20'
+        self.assertEqual(self.client.post(reverse('sales:order_edit', args=[order.id]), data).status_code, 302)
+        self.assertEqual(list(deposits.values_list('amount', flat=True)), [Decimal('20.00')])
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.current_balance, Decimal('-10.00'))
+        
+        data['customer_deposit'] = '0'
+        self.assertEqual(self.client.post(reverse('sales:order_edit', args=[order.id]), data).status_code, 302)
+        self.assertFalse(deposits.exists())
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.current_balance, Decimal('10.00'))
+    
+    def test_instant_sale_edit_binds_items_once(self):
+        """Test a rejected instant sale edit validates its items once and shows that formset"""
+        sale = SalesOrder.objects.create(
+            order_number='IS-BIND', sales_type='instant', customer_name='Walk-in',
+            order_date=date.today(), status='delivered', created_by=self.user
+        )
+        item = SalesOrderItem.objects.create(
+            sales_order=sale, product=self.product, warehouse=self.warehouse,
+            quantity=Decimal('2'), unit_price=Decimal('1.00'), total_price=Decimal('2.00')
+        )
+        data = self._instant_sale_data('11')
+        data.update(self._items_data('11', ids=(item.id,)))
+        
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('sales:instant_sales_edit', args=[sale.id]), data)
+        self.assertContains(response, 'Insufficient stock')
+        self.assertTrue(response.context['formset'].is_bound)
+        # One stock check for the items, reused for the error page, and one for the product list
+        self.assertEqual(len([q for q in ctx.captured_queries if 'SUM(' in q['sql']]), 2)
+    
+    def test_instant_sale_update_reads_items_once_for_ledger(self):
+        """Test editing a customer's instant sale totals and describes its items from one read"""
+        order = SalesOrder.objects.create(
+            order_number='IS-LEDGER', sales_type='instant', customer=self.customer,
+            order_date=date.today(), status='delivered', created_by=self.user
+        )
+        item = SalesOrderItem.objects.create(
+            sales_order=order, product=self.product, warehouse=self.warehouse,
+            quantity=Decimal('2'), unit_price=Decimal('3.00'), total_price=Decimal('6.00')
+        )
+        data = {
+            'sales_type': 'instant',
+            'customer_name': '',
+            'order_date': date.today().isoformat(),
+            **self._items_data('4', unit_price='3.00', ids=(item.id,)),
+        }
+        
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('sales:instant_sales_edit', args=[order.id]), data)
+        self.assertEqual(response.status_code, 302)
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, Decimal('12.00'))
+        ledger = CustomerLedger.objects.get(reference='IS-LEDGER', transaction_type='sale')
+        self.assertEqual(ledger.amount, Decimal('12.00'))
+        self.assertIn('Test Product - 4.00', ledger.description)
+        self.assertIn('Total: ৳12.00', ledger.description)
+        # Loaded once with their products for both the totals and the ledger
+        # description, rather than summed in SQL and then loaded again
+        sqls = [q['sql'] for q in ctx.captured_queries]
+        self.assertEqual(
+            len([sql for sql in sqls if sql.startswith('SELECT "sales_salesorderitem"') and '"stock_product"' in sql]), 1
+        )
+        self.assertFalse([sql for sql in sqls if 'SUM("sales_salesorderitem"."total_price")' in sql])
+
+
+class RoundedDecimalFieldTests(TestCase):
+    """Test cases for RoundedDecimalField input conversion"""
+    
+    def test_to_python_rounds_all_input_types(self):
+        """Test strings, ints, floats and Decimals all round half-up to 2 places"""
+        from sales.forms import RoundedDecimalField
+        field = RoundedDecimalField(max_digits=15, decimal_places=2)
+        
+        self.assertEqual(field.to_python('2.345'), Decimal('2.35'))
+        self.assertEqual(field.to_python(Decimal('2.345')), Decimal('2.35'))
+        self.assertEqual(field.to_python(7), Decimal('7.00'))
+        self.assertEqual(field.to_python(2.5), Decimal('2.50'))
+        self.assertIsNone(field.to_python(''))
+        self.assertIsNone(field.to_python(None))
+    
+    def test_to_python_rounds_to_places(self):
+        """Test the places argument sets the rounding precision"""
+        from sales.forms import RoundedDecimalField
+        field = RoundedDecimalField(max_digits=15, decimal_places=4, places=4)
+        
+        self.assertEqual(field.to_python('2.34565'), Decimal('2.3457'))
+        self.assertEqual(RoundedDecimalField(places=0).to_python('2.5'), Decimal('3'))
+
+
+class SalesOrderTotalsTests(TestCase):
+    """Test cases for aggregating sales order item totals"""
+    
+    def test_get_order_totals(self):
+        """Test subtotal, per-unit delivery charges and item count come from one query"""
+        from stock.models import UnitType
+        from sales.views import get_order_totals
+        unit_type = UnitType.objects.create(code='pcs', name='Pieces')
+        charged = Product.objects.create(
+            name='Charged', unit_type=unit_type, delivery_charge_per_unit=Decimal('1.25')
+        )
+        free = Product.objects.create(name='Free', unit_type=unit_type)
+        order = SalesOrder.objects.create(order_number='SO-TOT', order_date=date.today())
+        SalesOrderItem.objects.create(
+            sales_order=order, product=charged, quantity=Decimal('3'),
+            unit_price=Decimal('10.00'), total_price=Decimal('30.00')
+        )
+        SalesOrderItem.objects.create(
+            sales_order=order, product=free, quantity=Decimal('2'),
+            unit_price=Decimal('5.50'), total_price=Decimal('11.00')
+        )
+        
+        with self.assertNumQueries(1):
+            totals = get_order_totals(order)
+        self.assertEqual(totals['subtotal'], Decimal('41.00'))
+        self.assertEqual(totals['delivery_charges'], Decimal('3.75'))
+        self.assertEqual(totals['items_count'], 2)
+
+
+class SalesLedgerTests(TestCase):
+    """Test cases for batching customer ledger entries"""
+    
+    def test_save_ledger_batch(self):
+        """Test batched sale and deposit entries are saved with their net balance effect"""
+        from customers.models import CustomerLedger
+        from sales.views import (
+            create_customer_ledger_entry, create_or_update_deposit_ledger_entry, save_ledger_batch
+        )
+        customer = Customer.objects.create(name='Ledger Customer', current_balance=Decimal('10.00'))
+        order = SalesOrder.objects.create(
+            order_number='SO-LED', customer=customer, order_date=date.today(), total_amount=Decimal('100.00')
+        )
+        
+        batch = []
+        create_customer_ledger_entry(order, items=[], batch=batch)
+        create_or_update_deposit_ledger_entry(order, Decimal('30.00'), batch=batch)
+        self.assertFalse(CustomerLedger.objects.exists())
+        save_ledger_batch(customer, batch)
+        
+        self.assertEqual(
+            sorted(CustomerLedger.objects.values_list('reference', 'amount')),
+            [('SO-LED', Decimal('100.00')), ('SO-LED-DEPOSIT', Decimal('30.00'))]
+        )
+        customer.refresh_from_db()
+        self.assertEqual(customer.current_balance, Decimal('80.00'))
+    
+    def test_invoice_description_totals(self):
+        """Test the ledger description lists each item and falls back to per-unit delivery charges"""
+        from stock.models import UnitType
+        from sales.views import generate_invoice_description
+        unit_type = UnitType.objects.create(code='bag', name='Bag')
+        cement = Product.objects.create(name='Cement', unit_type=unit_type, delivery_charge_per_unit=Decimal('5'))
+        sand = Product.objects.create(name='Sand', unit_type=unit_type)
+        order = SalesOrder(
+            order_number='SO-DESC', order_date=date(2026, 1, 2),
+            delivery_charges=Decimal('0'), transportation_cost=Decimal('20.00')
+        )
+        items = [
+            SalesOrderItem(product=cement, quantity=Decimal('2'), unit_price=Decimal('500.00'), total_price=Decimal('1000.00')),
+            SalesOrderItem(product=sand, quantity=Decimal('1'), unit_price=Decimal('50.00'), total_price=Decimal('50.00')),
+        ]
+        
+        self.assertEqual(generate_invoice_description(order, items=items), "\n".join([
+            "SO-DESC | 2026-01-02",
+            "Cement - 2 Bag (bag) @ ৳500.00 = ৳1000.00",
+            "Sand - 1 Bag (bag) @ ৳50.00 = ৳50.00",
+            "Subtotal: ৳1050.00",
+            "Delivery: ৳10.00",
+            "Transport: ৳20.00",
+            "Total: ৳1080.00",
+        ]))
+        
+        order.delivery_charges = Decimal('15.00')
+        self.assertIn("Delivery: ৳15.00", generate_invoice_description(order, items=items))
+
+
+class SalesInvoiceCacheTests(TestCase):
+    """Test cases for caching rendered invoices"""
+    
+    def test_invoice_cache_follows_order_and_customer_updates(self):
+        """Test a cached invoice is replaced once the order or customer is saved"""
+        customer = Customer.objects.create(name='Original Name')
+        order = SalesOrder.objects.create(order_number='SO-INV', customer=customer, order_date=date.today())
+        url = reverse('sales:order_invoice', args=[order.id])
+        
+        self.assertContains(self.client.get(url), 'Original Name')
+        
+        customer.name = 'Renamed Customer'
+        customer.save()
+        self.assertContains(self.client.get(url), 'Renamed Customer')
+        
+        order.status = 'delivered'
+        order.save()
+        self.assertContains(self.client.get(url), 'Delivered')
+    
+    def test_invoice_cache_follows_item_and_product_changes(self):
+        """Test a cached invoice or chalan is replaced when its items or their products change outside the order"""
+        unit_type = UnitType.objects.create(code='pcs', name='Pieces')
+        product = Product.objects.create(name='Original Product', unit_type=unit_type)
+        order = SalesOrder.objects.create(order_number='SO-ITEMS', customer_name='Walk-in', order_date=date.today())
+        item = SalesOrderItem.objects.create(
+            sales_order=order, product=product,
+            quantity=Decimal('2'), unit_price=Decimal('5.00'), total_price=Decimal('10.00')
+        )
+        
+        for name, quantity in (('sales:order_invoice', '13'), ('sales:labour_chalan', '13.00')):
+            url = reverse(name, args=[order.id])
+            with self.subTest(document=name):
+                self.assertContains(self.client.get(url), product.name)
+                
+                SalesOrderItem.objects.filter(pk=item.pk).update(quantity=Decimal('13'))
+                self.assertContains(self.client.get(url), f'<td class="number-cell">{quantity}</td>', html=True)
+                SalesOrderItem.objects.filter(pk=item.pk).update(quantity=Decimal('2'))
+                
+                product.name = f'Renamed for {name}'
+                product.save()
+                self.assertContains(self.client.get(url), f'Renamed for {name}')
+    
+    def test_invoice_loads_only_document_columns(self):
+        """Test the invoice renders from the narrowed order query without loading deferred fields"""
+        customer = Customer.objects.create(name='Narrow Customer', phone='01700000000')
+        order = SalesOrder.objects.create(
+            order_number='SO-NARROW', customer=customer, order_date=date.today(), notes='Gate 2'
+        )
+        
+        # One query for the order and customer, one for its items
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('sales:order_invoice', args=[order.id]))
+        self.assertContains(response, 'Narrow Customer')
+        
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('sales:labour_chalan', args=[order.id]))
+        self.assertContains(response, 'Gate 2')
+
+
+class TileInfoTests(TestCase):
+    """Test cases for tile carton/sqft breakdowns on invoices"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        from stock.models import UnitType
+        cls.tiles = ProductCategory.objects.create(name='Tiles')
+        cls.sqft = UnitType.objects.create(code='sqft', name='Square Feet')
+        cls.pcs = UnitType.objects.create(code='pcs', name='Pieces')
+    
+    def _tile(self, unit_type, category=None):
+        return Product.objects.create(
+            name='Tile', category=category or self.tiles, unit_type=unit_type,
+            pcs_per_carton=4, sqft_per_pcs=Decimal('2.00')
+        )
+    
+    def test_quantity_in_sqft(self):
+        """Test sqft quantities are converted to pieces before splitting into cartons"""
+        from sales.views import compute_tile_info
+        info = compute_tile_info(self._tile(self.sqft), Decimal('21'))  # 10.5 pieces
+        self.assertEqual(info, {'total_sqft': Decimal('21'), 'cartons': 2, 'pieces': 2})
+    
+    def test_quantity_in_pieces(self):
+        """Test piece quantities are converted to sqft"""
+        from sales.views import compute_tile_info
+        info = compute_tile_info(self._tile(self.pcs), Decimal('9'))
+        self.assertEqual(info, {'total_sqft': Decimal('18.00'), 'cartons': 2, 'pieces': 1})
+    
+    def test_non_tile_product(self):
+        """Test products outside the Tiles category have no tile info"""
+        from sales.views import compute_tile_info
+        other = ProductCategory.objects.create(name='Cement')
+        self.assertIsNone(compute_tile_info(self._tile(self.pcs, category=other), Decimal('9')))
+
+
+class OrderNumberTests(TestCase):
+    """Test cases for sequential order numbers"""
+    
+    def test_numbers_are_sequential_per_prefix(self):
+        """Test each prefix counts up on its own within the current year"""
+        from sales.views import next_order_number
+        year = timezone.localdate().year
+        self.assertEqual(next_order_number('SO'), f'SO-{year}-00001')
+        self.assertEqual(next_order_number('SO'), f'SO-{year}-00002')
+        self.assertEqual(next_order_number('IS'), f'IS-{year}-00001')
+
+
+class SalesReportTests(TestCase):
+    """Test cases for the sales report pages"""
+    
+    def test_reports_load_customers_with_orders(self):
+        """Test report pages fetch each order's customer in the same query"""
+        for i in range(3):
+            customer = Customer.objects.create(name=f'Report Customer {i}')
+            SalesOrder.objects.create(order_number=f'SO-RPT-{i}', customer=customer, order_date=timezone.localdate())
+        
+        # One query for the ETag, one for the page count, one for the page's orders and customers
+        for name in ('sales:sales_daily_report', 'sales:sales_monthly_report', 'sales:sales_customer_report'):
+            with self.subTest(report=name), self.assertNumQueries(3):
+                response = self.client.get(reverse(name))
+                self.assertContains(response, 'Report Customer 2')
+    
+    def test_reports_are_paginated(self):
+        """Test report pages list 50 orders at a time"""
+        SalesOrder.objects.bulk_create([
+            SalesOrder(order_number=f'SO-PAGE-{i}', customer_name='Walk-in', order_date=timezone.localdate())
+            for i in range(51)
+        ])
+        
+        response = self.client.get(reverse('sales:sales_daily_report'))
+        self.assertEqual(len(response.context['reports']), 50)
+        self.assertContains(response, 'Page 1 of 2')
+        
+        response = self.client.get(reverse('sales:sales_daily_report'), {'page': 2})
+        self.assertEqual(len(response.context['reports']), 1)
+    
+    def test_unchanged_report_is_not_modified(self):
+        """Test a repeat request gets 304 until an order or its customer changes"""
+        customer = Customer.objects.create(name='Etag Customer')
+        order = SalesOrder.objects.create(order_number='SO-ETAG', customer=customer, order_date=timezone.localdate())
+        url = reverse('sales:sales_daily_report')
+        
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        
+        customer.name = 'Renamed Etag Customer'
+        customer.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Renamed Etag Customer')
+        
+        etag = response['ETag']
+        order.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+    
+    def test_new_period_is_not_served_stale(self):
+        """Test a tag from the last day or month stops matching once the period rolls over"""
+        # No orders in either period, so only the period tells the pages apart
+        for name, old, new in (
+            ('sales:sales_daily_report', date(2026, 3, 30), date(2026, 3, 31)),
+            ('sales:sales_monthly_report', date(2026, 3, 31), date(2026, 4, 1)),
+        ):
+            url = reverse(name)
+            with self.subTest(report=name):
+                with mock.patch('sales.views.timezone.localdate', return_value=old):
+                    etag = self.client.get(url)['ETag']
+                    self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+                with mock.patch('sales.views.timezone.localdate', return_value=new):
+                    self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class SalesOrderCreationTest(StockedProductTestCase):
+    """Test sales order creation functionality"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data shared by every test"""
+        super().setUpTestData()
+        
+        # Create user
+        cls.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123',
+            email='test@example.com'
+        )
+        
+        # Create customer
+        cls.customer = Customer.objects.create(
+            name='Test Customer',
+            contact_person='John Doe',
+            phone='1234567890',
+            address='123 Test St',
+            is_active=True
+        )
+        
+        # The shared product, with a per-unit delivery charge
+        Product.objects.filter(pk=cls.product.pk).update(delivery_charge_per_unit=Decimal('1.00'))
+        cls.product.refresh_from_db()
+    
+    def setUp(self):
+        """Log in a fresh client for each test"""
+        self.client = Client()
+        self.client.force_login(self.user)
+    
+    def test_sales_order_create_page_loads(self):
+        """Test that sales order create page loads successfully"""
+        url = reverse('sales:order_create')
+        response = self.client.get(url)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'New Sales Order')
+        self.assertContains(response, 'Customer')
+        self.assertContains(response, 'Products')
+    
+    def test_sales_order_creation_with_products(self):
+        """Test creating a sales order with products"""
+        url = reverse('sales:order_create')
+        order_date = date.today()
+        delivery_date = order_date + timedelta(days=7)
+        
+        form_data = {
+            'sales_type': 'regular',
+            'customer': self.customer.id,
+            'order_date': order_date.strftime('%Y-%m-%d'),
+            'delivery_date': delivery_date.strftime('%Y-%m-%d'),
+            'status': 'order',
+            'transportation_cost': '50.00',
+            'notes': 'Test order',
+            'items-TOTAL_FORMS': '1',
+            'items-INITIAL_FORMS': '0',
+            'items-MIN_NUM_FORMS': '0',
+            'items-MAX_NUM_FORMS': '1000',
+            'items-0-product': self.product.id,
+            'items-0-warehouse': self.warehouse.id,
+            'items-0-quantity': '10',
+            'items-0-unit_price': '150.00',
+            'items-0-total_price': '1500.00',
+        }
+        
+        response = self.client.post(url, data=form_data, follow=True)
+        
+        # Check if order was created
+        self.assertEqual(SalesOrder.objects.count(), 1)
+        order = SalesOrder.objects.first()
+        
+        # Check order details
+        self.assertEqual(order.customer, self.customer)
+        self.assertEqual(order.order_date, order_date)
+        self.assertEqual(order.status, 'order')
+        self.assertEqual(order.transportation_cost, Decimal('50.00'))
+        
+        # Check order items
+        self.assertEqual(order.items.count(), 1)
+        item = order.items.first()
+        self.assertEqual(item.product, self.product)
+        self.assertEqual(item.quantity, Decimal('10'))
+        self.assertEqual(item.unit_price, Decimal('150.00'))
+        self.assertEqual(item.total_price, Decimal('1500.00'))
+        
+        # Check total amount calculation
+        # Subtotal: 1500.00
+        # Delivery charges: 10 * 1.00 = 10.00
+        # Transportation: 50.00
+        # Total: 1500.00 + 10.00 + 50.00 = 1560.00
+        expected_total = Decimal('1560.00')
+        self.assertEqual(order.total_amount, expected_total)
+        
+        # Check redirect
+        self.assertRedirects(response, reverse('sales:order_list'))
+    
+    def test_sales_order_creation_without_products(self):
+        """Test creating a sales order without products (should still work)"""
+        url = reverse('sales:order_create')
+        order_date = date.today()
+        
+        form_data = {
+            'sales_type': 'regular',
+            'customer': self.customer.id,
+            'order_date': order_date.strftime('%Y-%m-%d'),
+            'status': 'order',
+            'transportation_cost': '0.00',
+            'notes': 'Empty order',
+            'items-TOTAL_FORMS': '0',
+            'items-INITIAL_FORMS': '0',
+            'items-MIN_NUM_FORMS': '0',
+            'items-MAX_NUM_FORMS': '1000',
+        }
+        
+        response = self.client.post(url, data=form_data, follow=True)
+        
+        # Check if order was created
+        self.assertEqual(SalesOrder.objects.count(), 1)
+        order = SalesOrder.objects.first()
+        
+        # Check order details
+        self.assertEqual(order.customer, self.customer)
+        self.assertEqual(order.items.count(), 0)
+        self.assertEqual(order.total_amount, Decimal('0.00'))
+    
+    def test_sales_order_creation_with_delivery_charges(self):
+        """Test that delivery charges are calculated correctly"""
+        url = reverse('sales:order_create')
+        order_date = date.today()
+        
+        form_data = {
+            'sales_type': 'regular',
+            'customer': self.customer.id,
+            'order_date': order_date.strftime('%Y-%m-%d'),
+            'status': 'order',
+            'transportation_cost': '25.00',
+            'notes': 'Test delivery charges',
+            'items-TOTAL_FORMS': '2',
+            'items-INITIAL_FORMS': '0',
+            'items-MIN_NUM_FORMS': '0',
+            'items-MAX_NUM_FORMS': '1000',
+            'items-0-product': self.product.id,
+            'items-0-warehouse': self.warehouse.id,
+            'items-0-quantity': '5',
+            'items-0-unit_price': '150.00',
+            'items-0-total_price': '750.00',
+            'items-1-product': self.product.id,
+            'items-1-warehouse': self.warehouse.id,
+            'items-1-quantity': '3',
+            'items-1-unit_price': '150.00',
+            'items-1-total_price': '450.00',
+        }
+        
+        response = self.client.post(url, data=form_data, follow=True)
+        
+        order = SalesOrder.objects.first()
+        
+        # Check total calculation
+        # Subtotal: 750.00 + 450.00 = 1200.00
+        # Delivery charges: (5 + 3) * 1.00 = 8.00
+        # Transportation: 25.00
+        # Total: 1200.00 + 8.00 + 25.00 = 1233.00
+        expected_total = Decimal('1233.00')
+        self.assertEqual(order.total_amount, expected_total)
+    
+    def test_sales_order_creation_validation_errors(self):
+        """Test that validation errors are shown properly"""
+        url = reverse('sales:order_create')
+        
+        # Submit form without required fields
+        form_data = {
+            'customer': '',
+            'order_date': '',
+            'items-TOTAL_FORMS': '0',
+            'items-INITIAL_FORMS': '0',
+        }
+        
+        response = self.client.post(url, data=form_data)
+        
+        # Should return form with errors (not redirect)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'error', count=None, status_code=200)
+    
+    def test_sales_order_creation_with_invalid_product_data(self):
+        """Test creating order with invalid product data"""
+        url = reverse('sales:order_create')
+        order_date = date.today()
+        
+        form_data = {
+            'sales_type': 'regular',
+            'customer': self.customer.id,
+            'order_date': order_date.strftime('%Y-%m-%d'),
+            'status': 'order',
+            'items-TOTAL_FORMS': '1',
+            'items-INITIAL_FORMS': '0',
+            'items-MIN_NUM_FORMS': '0',
+            'items-MAX_NUM_FORMS': '1000',
+            'items-0-product': self.product.id,
+            'items-0-warehouse': self.warehouse.id,
+            'items-0-quantity': '0',  # Invalid: quantity must be > 0
+            'items-0-unit_price': '150.00',
+        }
+        
+        response = self.client.post(url, data=form_data)
+        
+        # Should return form with errors
+        self.assertEqual(response.status_code, 200)
+        # Order should not be created
+        self.assertEqual(SalesOrder.objects.count(), 0)
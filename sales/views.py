@@ -2,68 +2,205 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy
 from django.contrib import messages
-from django.db import transaction
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, transaction
+from django.db.models import Sum, Count, Max, F, DecimalField
 from django.http import HttpResponse
+from django.views.decorators.http import condition
 from django.template.loader import get_template
+from django.core.cache import cache
 from django.conf import settings
 from django.utils import timezone
 from decimal import Decimal
+import logging
 import os
 from .models import (
-    SalesOrder, SalesOrderItem
+    SalesOrder, SalesOrderItem, OrderNumberSequence
 )
-from .forms import SalesOrderForm, SalesOrderItemFormSet, SalesOrderItemFormSetCustom, InstantSalesForm
+from .forms import SalesOrderForm, SalesOrderItemFormSet, SalesOrderItemCreateFormSet, InstantSalesForm
 from customers.models import Customer, CustomerLedger
-from stock.models import Product, ProductCategory, ProductBrand, Warehouse
+from stock.models import Product, Warehouse, annotate_realtime_quantity, get_product_filters
 from django.contrib.auth.models import User
 from core.utils import get_company_info
-import uuid
 
+logger = logging.getLogger(__name__)
 
-def generate_invoice_description(order):
+
+# How long a rendered invoice or chalan is kept; edits make new keys anyway
+ORDER_DOCUMENT_CACHE_TIMEOUT = 60 * 60
+
+
+def next_order_number(prefix):
+    """
+    Next sequential order number for prefix ('SO', 'IS'), restarting each
+    year, e.g. SO-2026-00042. Must be called inside the order's transaction.
+    """
+    key = f"{prefix}-{timezone.localdate().year}"
+    return f"{key}-{OrderNumberSequence.next_value(key):05d}"
+
+
+def order_document_cache_key(prefix, order):
+    """
+    Cache key for a rendered order document (invoice, chalan).
+    Versioned by the last update of the order, its customer and its items'
+    products, and by its items' count and totals (annotated by
+    get_order_document), so changing any of them leaves the old copy unused
+    until it expires.
+    """
+    def timestamp(value):
+        return value.timestamp() if value else ''
+    
+    customer_version = timestamp(order.customer.updated_at) if order.customer else ''
+    items_version = ':'.join(str(part) for part in (
+        order.items_count, order.items_quantity, order.items_total, order.last_item_id,
+        timestamp(order.products_updated), timestamp(order.unit_types_updated),
+        timestamp(order.categories_updated),
+    ))
+    return f"{prefix}:{order.pk}:{timestamp(order.updated_at)}:{customer_version}:{items_version}"
+
+
+def get_order_document(order_id):
+    """
+    Fetch an order with its customer for the invoice and labour chalan,
+    loading only the columns those documents and their cache key read
+    """
+    return get_object_or_404(
+        SalesOrder.objects.select_related('customer').only(
+            'id', 'order_number', 'sales_type', 'customer_name', 'order_date', 'delivery_date',
+            'status', 'total_amount', 'delivery_charges', 'transportation_cost',
+            'discount_amount', 'customer_deposit', 'notes', 'updated_at',
+            'customer__name', 'customer__phone', 'customer__address', 'customer__updated_at',
+        ).annotate(
+            # Item edits and product, unit or category changes made outside
+            # the order form don't touch the order, so the cache key reads these
+            items_count=Count('items'),
+            items_quantity=Sum('items__quantity'),
+            items_total=Sum('items__total_price'),
+            last_item_id=Max('items__id'),
+            products_updated=Max('items__product__updated_at'),
+            unit_types_updated=Max('items__product__unit_type__updated_at'),
+            categories_updated=Max('items__product__category__updated_at'),
+        ),
+        id=order_id
+    )
+
+
+def get_form_products():
+    """
+    Active products for the order form's product pickers, loading only the
+    fields (and category, brand and unit type columns) those scripts read
+    """
+    return Product.objects.filter(is_active=True).select_related('category', 'brand', 'unit_type').only(
+        'id', 'name', 'selling_price', 'delivery_charge_per_unit',
+        'category__id', 'brand__id', 'unit_type__name', 'unit_type__code',
+    )
+
+
+def get_order_items(order):
+    """
+    Fetch an order's items in one query, with the product, unit type and
+    warehouse that invoice lines read for each item
+    """
+    return list(order.items.select_related('product__unit_type', 'warehouse'))
+
+
+def compute_tile_info(product, quantity):
+    """
+    Work out square feet, full cartons and loose pieces for a line of tiles.
+    Quantity is in sqft when the product's unit type is sqft, otherwise in pieces.
+    Returns a dict with 'total_sqft', 'cartons' and 'pieces', or None when the
+    product isn't a tile or has no carton/sqft details.
+    """
+    if not product.is_tile:
+        return None
+    
+    pcs_per_carton = product.pcs_per_carton or 0
+    sqft_per_pcs = product.sqft_per_pcs or Decimal('0')
+    if sqft_per_pcs <= 0 or pcs_per_carton <= 0:
+        return None
+    
+    unit_code = product.unit_type.code.lower() if product.unit_type else ''
+    if unit_code == 'sqft':
+        total_sqft = quantity
+        total_pieces = total_sqft / sqft_per_pcs
+    else:
+        total_pieces = quantity
+        total_sqft = total_pieces * sqft_per_pcs
+    
+    # Whole pieces only; the same split as flooring the Decimal // and % results
+    cartons, pieces = divmod(int(total_pieces), pcs_per_carton)
+    return {
+        'total_sqft': total_sqft,
+        'cartons': cartons,
+        'pieces': pieces,
+    }
+
+
+def get_order_totals(order, items=None):
+    """
+    Sum an order's items in one query, for callers that don't need the items themselves
+    Returns a dict with the item 'subtotal', the per-unit 'delivery_charges'
+    and the 'items_count'
+    Pass items (from get_order_items) when the caller has already loaded them
+    """
+    if items is not None:
+        return {
+            'subtotal': sum((item.total_price for item in items), Decimal('0')),
+            'delivery_charges': sum(
+                (item.quantity * (item.product.delivery_charge_per_unit or Decimal('0')) for item in items),
+                Decimal('0')
+            ),
+            'items_count': len(items),
+        }
+    totals = order.items.aggregate(
+        subtotal=Sum('total_price'),
+        # Products without a per-unit charge add nothing, as NULLs are skipped by SUM
+        delivery_charges=Sum(
+            F('quantity') * F('product__delivery_charge_per_unit'),
+            output_field=DecimalField(max_digits=20, decimal_places=7)
+        ),
+        items_count=Count('id'),
+    )
+    return {
+        'subtotal': totals['subtotal'] or Decimal('0'),
+        'delivery_charges': totals['delivery_charges'] or Decimal('0'),
+        'items_count': totals['items_count'],
+    }
+
+
+def generate_invoice_description(order, items=None):
     """
     Generate full invoice description for customer ledger entry
     Includes all products, quantities, prices, delivery charges, and transportation cost
+    Pass items (from get_order_items) when the caller has already loaded them
     """
+    if items is None:
+        items = get_order_items(order)
     description_parts = []
     description_parts.append(f"{order.order_number} | {order.order_date.strftime('%Y-%m-%d')}")
     
-    # Add products
-    for item in order.items.all():
-        product_line = f"{item.product.name} - {item.quantity} {item.product.unit_type} @ ৳{item.unit_price:.2f} = ৳{item.total_price:.2f}"
+    # Add products, totalling the subtotal and per-unit delivery charges on the way
+    subtotal = Decimal('0')
+    calculated_delivery_charges = Decimal('0')
+    for item in items:
+        product = item.product
+        subtotal += item.total_price
+        calculated_delivery_charges += item.quantity * (product.delivery_charge_per_unit or Decimal('0'))
+        
+        product_line = f"{product.name} - {item.quantity} {product.unit_type} @ ৳{item.unit_price:.2f} = ৳{item.total_price:.2f}"
         
         # Add tile information if applicable
-        if item.product.category and item.product.category.name.lower() == 'tiles':
-            pcs_per_carton = item.product.pcs_per_carton or 0
-            sqft_per_pcs = item.product.sqft_per_pcs or Decimal('0')
-            if sqft_per_pcs > 0 and pcs_per_carton > 0:
-                unit_code = item.product.unit_type.code.lower() if item.product.unit_type else ''
-                if unit_code == 'sqft':
-                    total_sqft = item.quantity
-                    total_pieces = total_sqft / sqft_per_pcs
-                else:
-                    total_pieces = item.quantity
-                    total_sqft = total_pieces * sqft_per_pcs
-                
-                cartons = int(total_pieces // pcs_per_carton)
-                remaining_pieces = int(total_pieces % pcs_per_carton)
-                
-                product_line += f" ({int(total_sqft)} sqft, {cartons} carton"
-                if remaining_pieces > 0:
-                    product_line += f" {remaining_pieces} pcs"
-                product_line += ")"
+        tile_info = compute_tile_info(product, item.quantity)
+        if tile_info:
+            product_line += f" ({int(tile_info['total_sqft'])} sqft, {tile_info['cartons']} carton"
+            if tile_info['pieces'] > 0:
+                product_line += f" {tile_info['pieces']} pcs"
+            product_line += ")"
         
         description_parts.append(product_line)
     
-    # Calculate subtotal and charges
-    subtotal = sum(item.total_price for item in order.items.all())
-    # Use stored delivery_charges from order, or calculate if not set
-    delivery_charges = order.delivery_charges or Decimal('0')
-    if delivery_charges == 0:
-        # Calculate if not manually set
-        for item in order.items.all():
-            delivery_charge_per_unit = item.product.delivery_charge_per_unit or Decimal('0')
-            delivery_charges += item.quantity * delivery_charge_per_unit
+    # Use stored delivery_charges from order, or the calculated ones if not set
+    delivery_charges = order.delivery_charges or calculated_delivery_charges
     
     transportation_cost = order.transportation_cost or Decimal('0')
     total_amount = subtotal + delivery_charges + transportation_cost
@@ -83,15 +220,16 @@ def generate_invoice_description(order):
     return "\n".join(description_parts)
 
 
-def create_customer_ledger_entry(order, user=None, update_existing=False):
+def create_customer_ledger_entry(order, user=None, update_existing=False, items=None, batch=None):
     """
     Create or update customer ledger entry for sales order with full invoice details
+    A new entry is appended to batch, if given, instead of being saved (see save_ledger_batch)
     """
     if not order.customer:
         return None
     
     # Generate full invoice description
-    description = generate_invoice_description(order)
+    description = generate_invoice_description(order, items=items)
     
     # Check if ledger entry already exists for this order
     existing_entry = None
@@ -111,13 +249,12 @@ def create_customer_ledger_entry(order, user=None, update_existing=False):
         existing_entry.save()
         
         # Update customer balance (remove old amount, add new amount)
-        order.customer.current_balance = order.customer.current_balance - old_amount + order.total_amount
-        order.customer.save()
+        order.customer.adjust_balance(order.total_amount - old_amount)
         
         return existing_entry
     else:
         # Create new ledger entry
-        ledger_entry = CustomerLedger.objects.create(
+        ledger_entry = CustomerLedger(
             customer=order.customer,
             transaction_type='sale',
             amount=order.total_amount,
@@ -126,17 +263,21 @@ def create_customer_ledger_entry(order, user=None, update_existing=False):
             transaction_date=timezone.now(),
             created_by=user or order.created_by
         )
+        if batch is not None:
+            batch.append(ledger_entry)
+            return ledger_entry
+        ledger_entry.save()
         
         # Update customer balance
-        order.customer.current_balance += order.total_amount
-        order.customer.save()
+        order.customer.adjust_balance(order.total_amount)
         
         return ledger_entry
 
 
-def create_or_update_deposit_ledger_entry(order, deposit_amount, user=None, update_existing=False):
+def create_or_update_deposit_ledger_entry(order, deposit_amount, user=None, update_existing=False, batch=None):
     """
     Create or update customer ledger entry for customer deposit payment
+    A new entry is appended to batch, if given, instead of being saved (see save_ledger_batch)
     """
     if not order.customer or not deposit_amount or deposit_amount <= 0:
         return None
@@ -162,13 +303,12 @@ def create_or_update_deposit_ledger_entry(order, deposit_amount, user=None, upda
         
         # Update customer balance (remove old amount, add new amount)
         # Payment reduces customer balance (credit)
-        order.customer.current_balance = order.customer.current_balance + old_amount - deposit_amount
-        order.customer.save()
+        order.customer.adjust_balance(old_amount - deposit_amount)
         
         return existing_entry
     else:
         # Create new ledger entry
-        ledger_entry = CustomerLedger.objects.create(
+        ledger_entry = CustomerLedger(
             customer=order.customer,
             transaction_type='payment',
             amount=deposit_amount,
@@ -177,14 +317,32 @@ def create_or_update_deposit_ledger_entry(order, deposit_amount, user=None, upda
             transaction_date=timezone.now(),
             created_by=user or order.created_by
         )
+        if batch is not None:
+            batch.append(ledger_entry)
+            return ledger_entry
+        ledger_entry.save()
         
         # Update customer balance (payment reduces balance - credit)
-        order.customer.current_balance -= deposit_amount
-        order.customer.save()
+        order.customer.adjust_balance(-deposit_amount)
         
         return ledger_entry
 
 
+def save_ledger_batch(customer, entries):
+    """
+    Insert batched sale/payment ledger entries in one query and apply
+    their net effect to the customer's balance with one update
+    """
+    if not entries:
+        return
+    CustomerLedger.objects.bulk_create(entries)
+    # Sales add to the balance, payments (credit) reduce it
+    customer.adjust_balance(sum(
+        (entry.amount if entry.transaction_type == 'sale' else -entry.amount for entry in entries),
+        Decimal('0')
+    ))
+
+
 class SalesOrderListView(ListView):
     model = SalesOrder
     template_name = 'sales/order_list.html'
@@ -201,44 +359,51 @@ class SalesOrderCreateView(CreateView):
     form_class = SalesOrderForm
     template_name = 'sales/order_form.html'
     success_url = reverse_lazy('sales:order_list')
+    formset = None
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Create formset for order items
-        if self.request.POST:
-            context['formset'] = SalesOrderItemFormSetCustom(self.request.POST)
+        # Create formset for order items; a POST shows the one bound in post()
+        if self.formset is not None:
+            context['formset'] = self.formset
         else:
-            context['formset'] = SalesOrderItemFormSetCustom()
+            context['formset'] = SalesOrderItemCreateFormSet()
         
         # Add data for filtering
-        context['products'] = Product.objects.filter(is_active=True).select_related('category', 'brand')
-        context['categories'] = ProductCategory.objects.filter(is_active=True)
-        context['brands'] = ProductBrand.objects.filter(is_active=True)
+        context['products'] = get_form_products()
+        context.update(get_product_filters())
         context['warehouses'] = Warehouse.objects.filter(is_active=True).order_by('name')
         
         return context
     
+    def post(self, request, *args, **kwargs):
+        self.object = None
+        form = self.get_form()
+        # Bind the items once, to the order the form will save
+        self.formset = SalesOrderItemFormSet(request.POST, instance=form.instance)
+        if form.is_valid():
+            return self.form_valid(form)
+        return self.form_invalid(form)
+    
     def form_valid(self, form):
+        formset = self.formset
         try:
             with transaction.atomic():
-                # Generate unique order number
-                order_number = f"SO-{uuid.uuid4().hex[:8].upper()}"
-                form.instance.order_number = order_number
-                form.instance.created_by = self.request.user
-                
-                # Save the order first
-                response = super().form_valid(form)
-                
-                # Handle formset - now we have self.object
-                formset = SalesOrderItemFormSetCustom(self.request.POST, instance=self.object)
-                
-                # Validate formset
+                # Validate formset before saving anything; its stock locks last until commit
                 if formset.is_valid():
+                    # Next number in this year's sequence
+                    order_number = next_order_number('SO')
+                    form.instance.order_number = order_number
+                    form.instance.created_by = self.request.user
+                    
+                    # Save the order, then its items
+                    response = super().form_valid(form)
                     formset.save()
+                    items = get_order_items(self.object)
                     
                     # Calculate total amount (subtotal + delivery charges + transportation cost)
-                    subtotal = sum(item.total_price for item in self.object.items.all())
+                    subtotal = sum(item.total_price for item in items)
                     
                     # Get form's delivery_charges value (always use form value if provided, even if 0)
                     form_delivery_charges = form.cleaned_data.get('delivery_charges')
@@ -247,7 +412,7 @@ class SalesOrderCreateView(CreateView):
                     if form_delivery_charges is None:
                         # Calculate delivery charges automatically
                         delivery_charges = Decimal('0')
-                        for item in self.object.items.all():
+                        for item in items:
                             delivery_charge_per_unit = item.product.delivery_charge_per_unit or Decimal('0')
                             delivery_charges += item.quantity * delivery_charge_per_unit
                     else:
@@ -274,16 +439,21 @@ class SalesOrderCreateView(CreateView):
                     if total_amount < 0:
                         total_amount = Decimal('0')
                     self.object.total_amount = total_amount
-                    self.object.save()
+                    # Only the amounts changed since form.save(); updated_at must be listed for auto_now
+                    self.object.save(update_fields=[
+                        'delivery_charges', 'discount_amount', 'customer_deposit', 'total_amount', 'updated_at',
+                    ])
                     
                     # Create customer ledger entry with full invoice details
                     if self.object.customer:
-                        create_customer_ledger_entry(self.object, self.request.user)
+                        ledger_entries = []
+                        create_customer_ledger_entry(self.object, self.request.user, items=items, batch=ledger_entries)
                         # Create deposit ledger entry if deposit amount > 0
                         if customer_deposit > 0:
-                            create_or_update_deposit_ledger_entry(self.object, customer_deposit, self.request.user)
+                            create_or_update_deposit_ledger_entry(self.object, customer_deposit, self.request.user, batch=ledger_entries)
+                        save_ledger_batch(self.object.customer, ledger_entries)
                     
-                    items_count = self.object.items.count()
+                    items_count = len(items)
                     if items_count > 0:
                         messages.success(self.request, f"Sales order {order_number} created successfully with {items_count} products! Total: ৳{total_amount}")
                     else:
@@ -308,43 +478,27 @@ class SalesOrderCreateView(CreateView):
                     
                     # Return form_invalid to show errors
                     return self.form_invalid(form)
+            
+            return response
                 
-                return response
-                
-        except Exception as e:
-            import traceback
-            error_details = traceback.format_exc()
-            error_msg = f"Error creating sales order: {str(e)}"
-            messages.error(self.request, error_msg)
-            # Log the full error for debugging
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f"Sales order creation error: {error_details}")
-            print(f"ERROR: {error_details}")  # Also print for immediate debugging
+        except (ValidationError, DatabaseError):
+            # The traceback goes to the log, not into the page
+            logger.exception("Sales order creation error")
+            messages.error(self.request, "Error creating sales order. Please check the details and try again.")
             return self.form_invalid(form)
     
     def form_invalid(self, form):
         """Handle invalid form submission with better error display"""
-        # Re-create formset with errors
-        # For new orders, object might not exist yet
-        instance = None
-        if hasattr(self, 'object') and self.object:
-            instance = self.object
-        
-        if self.request.POST:
-            formset = SalesOrderItemFormSetCustom(self.request.POST, instance=instance)
-        else:
-            formset = SalesOrderItemFormSetCustom(instance=instance)
-        
-        # Add formset to context
+        # The context shows the formset bound in post(), with its errors
         context = self.get_context_data(form=form)
-        context['formset'] = formset
+        formset = context['formset']
         
-        # Print errors for debugging
-        print(f"DEBUG: Form errors: {form.errors}")
-        print(f"DEBUG: Formset errors: {formset.errors}")
-        if formset.non_form_errors():
-            print(f"DEBUG: Formset non-form errors: {formset.non_form_errors()}")
+        # Log errors for debugging; reading formset errors validates it, so only when wanted
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Form errors: %s", form.errors)
+            logger.debug("Formset errors: %s", formset.errors)
+            if formset.non_form_errors():
+                logger.debug("Formset non-form errors: %s", formset.non_form_errors())
         
         return self.render_to_response(context)
 
@@ -354,38 +508,47 @@ class SalesOrderUpdateView(UpdateView):
     form_class = SalesOrderForm
     template_name = 'sales/order_form.html'
     success_url = reverse_lazy('sales:order_list')
+    formset = None
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Create formset for order items
-        if self.request.POST:
-            context['formset'] = SalesOrderItemFormSet(self.request.POST, instance=self.object)
+        # Create formset for order items; a POST shows the one bound in post()
+        if self.formset is not None:
+            context['formset'] = self.formset
         else:
             # For editing, only show existing items, no extra blank forms
             context['formset'] = SalesOrderItemFormSet(instance=self.object)
         
         # Add data for filtering
-        context['products'] = Product.objects.filter(is_active=True).select_related('category', 'brand')
-        context['categories'] = ProductCategory.objects.filter(is_active=True)
-        context['brands'] = ProductBrand.objects.filter(is_active=True)
+        context['products'] = get_form_products()
+        context.update(get_product_filters())
         context['warehouses'] = Warehouse.objects.filter(is_active=True).order_by('name')
         
         return context
     
+    def post(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        form = self.get_form()
+        # Bind the items once; form_valid validates them and form_invalid shows them
+        self.formset = SalesOrderItemFormSet(request.POST, instance=self.object)
+        if form.is_valid():
+            return self.form_valid(form)
+        return self.form_invalid(form)
+    
     def form_valid(self, form):
+        formset = self.formset
         try:
             with transaction.atomic():
-                # Save the order
-                response = super().form_valid(form)
-                
-                # Handle formset
-                formset = SalesOrderItemFormSet(self.request.POST, instance=self.object)
+                # Validate the items before saving anything, so a rejected row leaves the order as it was
                 if formset.is_valid():
+                    # Save the order, then its items
+                    response = super().form_valid(form)
                     formset.save()
+                    items = get_order_items(self.object)
                     
                     # Calculate total amount (subtotal + delivery charges + transportation cost)
-                    subtotal = sum(item.total_price for item in self.object.items.all())
+                    subtotal = sum(item.total_price for item in items)
                     
                     # Always use form's delivery_charges value (respects manual input, even if 0)
                     delivery_charges = form.cleaned_data.get('delivery_charges', self.object.delivery_charges or Decimal('0'))
@@ -400,8 +563,9 @@ class SalesOrderUpdateView(UpdateView):
                     discount_amount = form.cleaned_data.get('discount_amount') or Decimal('0')
                     self.object.discount_amount = discount_amount
                     
-                    # Get customer deposit (handle both new and existing deposits)
-                    old_deposit = self.object.customer_deposit or Decimal('0')
+                    # Get customer deposit (handle both new and existing deposits); the saved
+                    # object already holds the new one, so the old comes from the form's initial data
+                    old_deposit = form.initial.get('customer_deposit') or Decimal('0')
                     new_deposit = form.cleaned_data.get('customer_deposit') or Decimal('0')
                     self.object.customer_deposit = new_deposit
                     
@@ -411,29 +575,30 @@ class SalesOrderUpdateView(UpdateView):
                     if total_amount < 0:
                         total_amount = Decimal('0')
                     self.object.total_amount = total_amount
-                    self.object.save()
+                    # Only the amounts changed since form.save(); updated_at must be listed for auto_now
+                    self.object.save(update_fields=[
+                        'delivery_charges', 'discount_amount', 'customer_deposit', 'total_amount', 'updated_at',
+                    ])
                     
                     # Update customer ledger entry with full invoice details
                     if self.object.customer:
-                        create_customer_ledger_entry(self.object, self.request.user, update_existing=True)
+                        create_customer_ledger_entry(self.object, self.request.user, update_existing=True, items=items)
                         # Handle deposit ledger entry
                         if new_deposit > 0:
                             # Create or update deposit ledger entry
                             create_or_update_deposit_ledger_entry(self.object, new_deposit, self.request.user, update_existing=True)
                         elif old_deposit > 0 and new_deposit == 0:
                             # If deposit was removed, delete the deposit ledger entry and reverse the balance
-                            existing_deposit_entry = CustomerLedger.objects.filter(
+                            deleted, _ = CustomerLedger.objects.filter(
                                 customer=self.object.customer,
                                 reference=f"{self.object.order_number}-DEPOSIT",
                                 transaction_type='payment'
-                            ).first()
-                            if existing_deposit_entry:
+                            ).delete()
+                            if deleted:
                                 # Reverse the balance change
-                                self.object.customer.current_balance += old_deposit
-                                self.object.customer.save()
-                                existing_deposit_entry.delete()
+                                self.object.customer.adjust_balance(old_deposit)
                     
-                    items_count = self.object.items.count()
+                    items_count = len(items)
                     messages.success(self.request, f"Sales order {self.object.order_number} updated successfully with {items_count} products! Total: ৳{total_amount}")
                 else:
                     messages.error(self.request, "Please fix the errors in the product selection.")
@@ -441,8 +606,9 @@ class SalesOrderUpdateView(UpdateView):
                 
                 return response
                 
-        except Exception as e:
-            messages.error(self.request, f"Error updating sales order: {str(e)}")
+        except (ValidationError, DatabaseError):
+            logger.exception("Sales order update error")
+            messages.error(self.request, "Error updating sales order. Please check the details and try again.")
             return self.form_invalid(form)
 
 
@@ -454,35 +620,73 @@ class SalesOrderDeleteView(DeleteView):
 
 
 
-class SalesDailyReportView(ListView):
+class ConditionalReportMixin:
+    """
+    Answer a repeat GET for a report page with 304 Not Modified while its
+    orders and their customers are unchanged, skipping the page render
+    """
+    
+    def get_report_period(self):
+        """The date window the report covers, for reports over a moving window"""
+        return ''
+    
+    def report_etag(self, request, *args, **kwargs):
+        # The count catches deleted orders, the latest updates catch edits;
+        # the period keeps yesterday's tag from matching today's page, and
+        # the page also shows who is logged in
+        stats = self.get_queryset().aggregate(
+            orders=Count('id'),
+            order_updated=Max('updated_at'),
+            customer_updated=Max('customer__updated_at'),
+        )
+        return "{}-{}-{}-{}-{}".format(
+            request.user.pk, self.get_report_period(),
+            stats['orders'], stats['order_updated'], stats['customer_updated']
+        )
+    
+    def dispatch(self, request, *args, **kwargs):
+        return condition(etag_func=self.report_etag)(super().dispatch)(request, *args, **kwargs)
+
+
+class SalesDailyReportView(ConditionalReportMixin, ListView):
     model = SalesOrder
     template_name = 'sales/sales_daily_report.html'
     context_object_name = 'reports'
+    paginate_by = 50
+    
+    def get_report_period(self):
+        return timezone.localdate()
     
     def get_queryset(self):
-        from django.utils import timezone
-        today = timezone.now().date()
-        return SalesOrder.objects.filter(order_date=today)
+        return SalesOrder.objects.filter(order_date=self.get_report_period()).select_related('customer')
 
 
-class SalesMonthlyReportView(ListView):
+class SalesMonthlyReportView(ConditionalReportMixin, ListView):
     model = SalesOrder
     template_name = 'sales/sales_monthly_report.html'
     context_object_name = 'reports'
+    paginate_by = 50
+    
+    def get_report_period(self):
+        return timezone.localdate().strftime('%Y-%m')
     
     def get_queryset(self):
-        from django.utils import timezone
-        now = timezone.now()
+        today = timezone.localdate()
         return SalesOrder.objects.filter(
-            order_date__year=now.year,
-            order_date__month=now.month
-        )
+            order_date__year=today.year,
+            order_date__month=today.month
+        ).select_related('customer')
 
 
-class SalesCustomerReportView(ListView):
+class SalesCustomerReportView(ConditionalReportMixin, ListView):
     model = SalesOrder
     template_name = 'sales/sales_customer_report.html'
     context_object_name = 'reports'
+    paginate_by = 50
+    
+    def get_queryset(self):
+        # Each row shows the customer's name
+        return SalesOrder.objects.select_related('customer')
 
 
 
@@ -528,10 +732,17 @@ def cancel_sales_order(request, order_id):
 def sales_order_invoice(request, order_id):
     """Generate PDF invoice for sales order"""
     try:
-        order = get_object_or_404(SalesOrder, id=order_id)
+        order = get_order_document(order_id)
+        
+        cache_key = order_document_cache_key('invoice', order)
+        html = cache.get(cache_key)
+        if html is not None:
+            return HttpResponse(html, content_type='text/html')
+        
+        items = get_order_items(order)
         
         # Calculate subtotal (products only)
-        subtotal = sum(item.total_price for item in order.items.all())
+        subtotal = sum(item.total_price for item in items)
         
         # Use stored delivery_charges from order (respects manual 0 if set)
         delivery_charges = order.delivery_charges or Decimal('0')
@@ -540,7 +751,7 @@ def sales_order_invoice(request, order_id):
         
         # Calculate delivery charges per item for display
         calculated_delivery_charges = Decimal('0')
-        for item in order.items.all():
+        for item in items:
             delivery_charge_per_unit = item.product.delivery_charge_per_unit or Decimal('0')
             item_delivery_charge = item.quantity * delivery_charge_per_unit
             calculated_delivery_charges += item_delivery_charge
@@ -551,34 +762,7 @@ def sales_order_invoice(request, order_id):
             })
             
             # Calculate tile information if category is "Tiles"
-            tile_info = None
-            if item.product.category and item.product.category.name.lower() == 'tiles':
-                pcs_per_carton = item.product.pcs_per_carton or 0
-                sqft_per_pcs = item.product.sqft_per_pcs or Decimal('0')
-                
-                if sqft_per_pcs > 0 and pcs_per_carton > 0:
-                    # Check if quantity is in sqft or pieces based on unit type
-                    unit_code = item.product.unit_type.code.lower() if item.product.unit_type else ''
-                    
-                    if unit_code == 'sqft':
-                        # Quantity is in sqft
-                        total_sqft = item.quantity
-                        total_pieces = total_sqft / sqft_per_pcs
-                    else:
-                        # Quantity is in pieces, calculate sqft
-                        total_pieces = item.quantity
-                        total_sqft = total_pieces * sqft_per_pcs
-                    
-                    # Calculate cartons and remaining pieces
-                    cartons = int(total_pieces // pcs_per_carton)
-                    remaining_pieces = int(total_pieces % pcs_per_carton)
-                    
-                    tile_info = {
-                        'total_sqft': total_sqft,
-                        'cartons': cartons,
-                        'pieces': remaining_pieces,
-                    }
-            
+            tile_info = compute_tile_info(item.product, item.quantity)
             items_with_tile_info.append({
                 'item': item,
                 'tile_info': tile_info,
@@ -602,7 +786,7 @@ def sales_order_invoice(request, order_id):
         company_info = get_company_info()
         context = {
             'order': order,
-            'items': order.items.all(),
+            'items': items,
             'items_with_tile_info': items_with_tile_info,
             'items_with_delivery': items_with_delivery,
             'subtotal': subtotal,
@@ -615,6 +799,7 @@ def sales_order_invoice(request, order_id):
         
         # Render HTML
         html = template.render(context)
+        cache.set(cache_key, html, ORDER_DOCUMENT_CACHE_TIMEOUT)
         
         # For now, return HTML response (can be enhanced with PDF generation later)
         return HttpResponse(html, content_type='text/html')
@@ -627,41 +812,21 @@ def sales_order_invoice(request, order_id):
 def labour_chalan(request, order_id):
     """Generate labour chalan PDF for sales order (no cost calculations)"""
     try:
-        order = get_object_or_404(SalesOrder, id=order_id)
+        order = get_order_document(order_id)
+        
+        cache_key = order_document_cache_key('labour_chalan', order)
+        html = cache.get(cache_key)
+        if html is not None:
+            return HttpResponse(html, content_type='text/html')
+        
+        items = get_order_items(order)
         
         items_with_tile_info = []
         
         # Prepare items with tile information (if applicable)
-        for item in order.items.all():
+        for item in items:
             # Calculate tile information if category is "Tiles"
-            tile_info = None
-            if item.product.category and item.product.category.name.lower() == 'tiles':
-                pcs_per_carton = item.product.pcs_per_carton or 0
-                sqft_per_pcs = item.product.sqft_per_pcs or Decimal('0')
-                
-                if sqft_per_pcs > 0 and pcs_per_carton > 0:
-                    # Check if quantity is in sqft or pieces based on unit type
-                    unit_code = item.product.unit_type.code.lower() if item.product.unit_type else ''
-                    
-                    if unit_code == 'sqft':
-                        # Quantity is in sqft
-                        total_sqft = item.quantity
-                        total_pieces = total_sqft / sqft_per_pcs
-                    else:
-                        # Quantity is in pieces, calculate sqft
-                        total_pieces = item.quantity
-                        total_sqft = total_pieces * sqft_per_pcs
-                    
-                    # Calculate cartons and remaining pieces
-                    cartons = int(total_pieces // pcs_per_carton)
-                    remaining_pieces = int(total_pieces % pcs_per_carton)
-                    
-                    tile_info = {
-                        'total_sqft': total_sqft,
-                        'cartons': cartons,
-                        'pieces': remaining_pieces,
-                    }
-            
+            tile_info = compute_tile_info(item.product, item.quantity)
             items_with_tile_info.append({
                 'item': item,
                 'tile_info': tile_info,
@@ -674,13 +839,14 @@ def labour_chalan(request, order_id):
         company_info = get_company_info()
         context = {
             'order': order,
-            'items': order.items.all(),
+            'items': items,
             'items_with_tile_info': items_with_tile_info,
             **company_info,  # Unpack company info into context
         }
         
         # Render HTML
         html = template.render(context)
+        cache.set(cache_key, html, ORDER_DOCUMENT_CACHE_TIMEOUT)
         
         # For now, return HTML response (can be enhanced with PDF generation later)
         return HttpResponse(html, content_type='text/html')
@@ -696,62 +862,70 @@ class InstantSalesCreateView(CreateView):
     form_class = InstantSalesForm
     template_name = 'sales/instant_sales_form.html'
     success_url = reverse_lazy('sales:order_list')
+    formset = None
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Create formset for order items
-        if self.request.POST:
-            context['formset'] = SalesOrderItemFormSetCustom(self.request.POST, instance=self.object)
+        # Create formset for order items; a POST shows the one bound in post()
+        if self.formset is not None:
+            context['formset'] = self.formset
         else:
             # For GET requests, create formset without instance (new order)
-            context['formset'] = SalesOrderItemFormSetCustom()
+            context['formset'] = SalesOrderItemCreateFormSet()
         
         # Add data for filtering
-        context['products'] = Product.objects.filter(is_active=True).select_related('category', 'brand')
-        context['categories'] = ProductCategory.objects.filter(is_active=True)
-        context['brands'] = ProductBrand.objects.filter(is_active=True)
+        # The instant sale form shows each product's stock, worked out in the same query
+        context['products'] = annotate_realtime_quantity(get_form_products())
+        context.update(get_product_filters())
         
         return context
     
+    def post(self, request, *args, **kwargs):
+        self.object = None
+        form = self.get_form()
+        # Bind the items once, to the sale the form will save
+        self.formset = SalesOrderItemCreateFormSet(request.POST, instance=form.instance)
+        if form.is_valid():
+            return self.form_valid(form)
+        return self.form_invalid(form)
+    
     def form_valid(self, form):
+        formset = self.formset
         try:
-            print(f"DEBUG: Form is valid, data: {form.cleaned_data}")
-            print(f"DEBUG: POST data: {self.request.POST}")
+            logger.debug("Form is valid, data: %s", form.cleaned_data)
+            logger.debug("POST data: %s", self.request.POST)
             
             with transaction.atomic():
-                # Generate unique order number
-                order_number = f"IS-{uuid.uuid4().hex[:8].upper()}"
-                form.instance.order_number = order_number
-                form.instance.sales_type = 'instant'
-                form.instance.status = 'delivered'  # Instant sales are immediately delivered
-                form.instance.created_by = self.request.user
-                
-                # Save the order first
-                self.object = form.save()
-                print(f"DEBUG: Order saved with ID: {self.object.id}")
-                
-                # Handle formset - create with the saved instance
-                formset = SalesOrderItemFormSetCustom(self.request.POST, instance=self.object)
-                print(f"DEBUG: Formset is_valid: {formset.is_valid()}")
-                print(f"DEBUG: Formset errors: {formset.errors}")
-                
+                # Validate formset before saving anything; its stock locks last until commit
                 if formset.is_valid():
+                    # Next number in this year's sequence
+                    order_number = next_order_number('IS')
+                    form.instance.order_number = order_number
+                    form.instance.sales_type = 'instant'
+                    form.instance.status = 'delivered'  # Instant sales are immediately delivered
+                    form.instance.created_by = self.request.user
+                    
+                    # Save the order, then its items
+                    self.object = form.save()
+                    logger.debug("Order saved with ID: %s", self.object.id)
                     formset.save()
-                    print(f"DEBUG: Formset saved successfully")
+                    logger.debug("Formset saved successfully")
+                    
+                    # The ledger description lists a customer's items, so load them once
+                    # and total them in Python; walk-in sales only need the sums
+                    items = get_order_items(self.object) if self.object.customer else None
                     
                     # Calculate total amount (subtotal + delivery charges + transportation cost)
-                    subtotal = sum(item.total_price for item in self.object.items.all())
+                    totals = get_order_totals(self.object, items=items)
+                    subtotal = totals['subtotal']
                     
                     # Use form's delivery_charges value (respects manual input, even if 0)
                     # For instant sales, calculate if not manually set
                     delivery_charges = self.object.delivery_charges or Decimal('0')
                     if delivery_charges == 0:
                         # Calculate delivery charges automatically
-                        delivery_charges = Decimal('0')
-                        for item in self.object.items.all():
-                            delivery_charge_per_unit = item.product.delivery_charge_per_unit or Decimal('0')
-                            delivery_charges += item.quantity * delivery_charge_per_unit
+                        delivery_charges = totals['delivery_charges']
                     
                     # Save delivery charges value
                     self.object.delivery_charges = delivery_charges
@@ -768,12 +942,13 @@ class InstantSalesCreateView(CreateView):
                     if total_amount < 0:
                         total_amount = Decimal('0')
                     self.object.total_amount = total_amount
-                    self.object.save()
-                    print(f"DEBUG: Total amount set to: {total_amount}")
+                    # Only the amounts changed since form.save(); updated_at must be listed for auto_now
+                    self.object.save(update_fields=['delivery_charges', 'total_amount', 'updated_at'])
+                    logger.debug("Total amount set to: %s", total_amount)
                     
                     # Create customer ledger entry with full invoice details
                     if self.object.customer:
-                        create_customer_ledger_entry(self.object, self.request.user)
+                        create_customer_ledger_entry(self.object, self.request.user, items=items)
                     
                     # Inventory is calculated in real-time from sales orders
                     # Instant sales (sales_type='instant') are automatically included
@@ -782,30 +957,32 @@ class InstantSalesCreateView(CreateView):
                     # Low stock alerts are now calculated dynamically based on min_stock_level
                     # No need to create/store alerts - they're computed in real-time
                     
-                    items_count = self.object.items.count()
-                    print(f"DEBUG: Final items count: {items_count}")
+                    items_count = totals['items_count']
+                    logger.debug("Final items count: %s", items_count)
                     if items_count > 0:
                         messages.success(self.request, f"Instant sale {order_number} completed successfully with {items_count} products! Total: ৳{total_amount}")
                     else:
                         messages.warning(self.request, f"Instant sale {order_number} created without items. Please add products to complete the sale.")
                 else:
-                    print(f"DEBUG: Formset validation failed: {formset.errors}")
-                    messages.error(self.request, f"Please fix the errors in the product selection. Errors: {formset.errors}")
+                    logger.debug("Formset validation failed: %s", formset.errors)
+                    # The rows show their own errors; the message stays plain
+                    messages.error(self.request, "Please fix the errors in the product selection.")
                     return self.form_invalid(form)
+            
+            # Return redirect response
+            return redirect(self.success_url)
                 
-                # Return redirect response
-                return redirect(self.success_url)
-                
-        except Exception as e:
-            print(f"DEBUG: Exception occurred: {str(e)}")
-            messages.error(self.request, f"Error creating instant sale: {str(e)}")
+        except (ValidationError, DatabaseError):
+            logger.exception("Instant sale creation error")
+            messages.error(self.request, "Error creating instant sale. Please check the details and try again.")
             return self.form_invalid(form)
     
     def form_invalid(self, form):
-        print(f"DEBUG: Form is invalid, errors: {form.errors}")
-        if hasattr(self, 'object') and self.object:
-            formset = SalesOrderItemFormSetCustom(self.request.POST, instance=self.object)
-            print(f"DEBUG: Formset errors: {formset.errors}")
+        # Validating the items just to log their errors is only worth it when debugging
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Form is invalid, errors: %s", form.errors)
+            if self.formset is not None:
+                logger.debug("Formset errors: %s", self.formset.errors)
         return super().form_invalid(form)
 
 
@@ -815,41 +992,55 @@ class InstantSalesUpdateView(UpdateView):
     form_class = InstantSalesForm
     template_name = 'sales/instant_sales_form.html'
     success_url = reverse_lazy('sales:order_list')
+    formset = None
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Create formset for order items
-        if self.request.POST:
-            context['formset'] = SalesOrderItemFormSet(self.request.POST, instance=self.object)
+        # Create formset for order items; a POST shows the one bound in post()
+        if self.formset is not None:
+            context['formset'] = self.formset
         else:
             # For editing, only show existing items, no extra blank forms
             context['formset'] = SalesOrderItemFormSet(instance=self.object)
         
         # Add data for filtering
-        context['products'] = Product.objects.filter(is_active=True).select_related('category', 'brand')
-        context['categories'] = ProductCategory.objects.filter(is_active=True)
-        context['brands'] = ProductBrand.objects.filter(is_active=True)
+        # The instant sale form shows each product's stock, worked out in the same query
+        context['products'] = annotate_realtime_quantity(get_form_products())
+        context.update(get_product_filters())
         
         return context
     
+    def post(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        form = self.get_form()
+        # Bind the items once; form_valid validates them and form_invalid shows them
+        self.formset = SalesOrderItemFormSet(request.POST, instance=self.object)
+        if form.is_valid():
+            return self.form_valid(form)
+        return self.form_invalid(form)
+    
     def form_valid(self, form):
+        formset = self.formset
         try:
             with transaction.atomic():
                 # Ensure sales_type remains 'instant'
                 form.instance.sales_type = 'instant'
                 form.instance.status = 'delivered'  # Instant sales are immediately delivered
                 
-                # Save the order
-                response = super().form_valid(form)
-                
-                # Handle formset
-                formset = SalesOrderItemFormSet(self.request.POST, instance=self.object)
+                # Validate the items before saving anything, so a rejected row leaves the sale as it was
                 if formset.is_valid():
+                    # Save the sale, then its items
+                    response = super().form_valid(form)
                     formset.save()
                     
+                    # The ledger description lists a customer's items, so load them once
+                    # and total them in Python; walk-in sales only need the sums
+                    items = get_order_items(self.object) if self.object.customer else None
+                    
                     # Calculate total amount (subtotal + delivery charges + transportation cost)
-                    subtotal = sum(item.total_price for item in self.object.items.all())
+                    totals = get_order_totals(self.object, items=items)
+                    subtotal = totals['subtotal']
                     
                     # Always use form's delivery_charges value (respects manual input, even if 0)
                     delivery_charges = self.object.delivery_charges or Decimal('0')
@@ -869,13 +1060,14 @@ class InstantSalesUpdateView(UpdateView):
                     if total_amount < 0:
                         total_amount = Decimal('0')
                     self.object.total_amount = total_amount
-                    self.object.save()
+                    # Only the amounts changed since form.save(); updated_at must be listed for auto_now
+                    self.object.save(update_fields=['delivery_charges', 'total_amount', 'updated_at'])
                     
                     # Update customer ledger entry with full invoice details
                     if self.object.customer:
-                        create_customer_ledger_entry(self.object, self.request.user, update_existing=True)
+                        create_customer_ledger_entry(self.object, self.request.user, update_existing=True, items=items)
                     
-                    items_count = self.object.items.count()
+                    items_count = totals['items_count']
                     messages.success(self.request, f"Instant sale {self.object.order_number} updated successfully with {items_count} products! Total: ৳{total_amount}")
                 else:
                     messages.error(self.request, "Please fix the errors in the product selection.")
@@ -883,6 +1075,7 @@ class InstantSalesUpdateView(UpdateView):
                 
                 return response
                 
-        except Exception as e:
-            messages.error(self.request, f"Error updating instant sale: {str(e)}")
+        except (ValidationError, DatabaseError):
+            logger.exception("Instant sale update error")
+            messages.error(self.request, "Error updating instant sale. Please check the details and try again.")
             return self.form_invalid(form)
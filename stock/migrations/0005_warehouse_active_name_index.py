@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-15 22:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0004_alter_product_delivery_charge_per_unit'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='warehouse',
+            index=models.Index(fields=['is_active', 'name'], name='stock_wareh_is_acti_043a1a_idx'),
+        ),
+    ]
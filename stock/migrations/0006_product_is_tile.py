@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-15 23:13
+
+from django.db import migrations, models
+
+from stock.models import sync_tile_flags
+
+
+def set_is_tile(apps, schema_editor):
+    Product = apps.get_model('stock', 'Product')
+    sync_tile_flags(Product.objects.all())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0005_warehouse_active_name_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='is_tile',
+            field=models.BooleanField(default=False, editable=False, help_text='Set from the category; true for products in the Tiles category'),
+        ),
+        migrations.RunPython(set_is_tile, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 00:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0006_product_is_tile'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='is_tile',
+            field=models.BooleanField(db_index=True, default=False, editable=False, help_text='Set from the category; true for products in the Tiles category'),
+        ),
+    ]
@@ -1,23 +1,145 @@
 from django.db import models
+from django.db.models.functions import Coalesce, Greatest
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.utils import timezone
 from decimal import Decimal
 
-def get_low_stock_products():
-    """Helper function to get products with low stock based on min_stock_level"""
-    products = Product.objects.filter(is_active=True)
+# Cached category/brand filter options; saving or deleting either clears them
+# (see stock/signals.py), and the timeout bounds how long other processes can
+# show stale options
+PRODUCT_FILTERS_CACHE_KEY = 'stock:product_filters'
+PRODUCT_FILTERS_CACHE_TIMEOUT = 5 * 60
+
+
+def get_product_filters():
+    """
+    Active categories and brands as id/name dicts, for the product filter
+    dropdowns on the sales forms. Returns a dict with 'categories' and 'brands'.
+    """
+    def load():
+        return {
+            'categories': list(ProductCategory.objects.filter(is_active=True).values('id', 'name')),
+            'brands': list(ProductBrand.objects.filter(is_active=True).values('id', 'name')),
+        }
+    return cache.get_or_set(PRODUCT_FILTERS_CACHE_KEY, load, PRODUCT_FILTERS_CACHE_TIMEOUT)
+
+
+def sync_tile_flags(products):
+    """
+    Set Product.is_tile on the given products from their category: true exactly
+    for products in the Tiles category. The one rule for the flag, used by the
+    category signals and the migration that added it; run it after bulk
+    category updates, which send no signals.
+    """
+    products.filter(category__name__iexact='tiles', is_tile=False).update(is_tile=True)
+    products.filter(is_tile=True).exclude(category__name__iexact='tiles').update(is_tile=False)
+
+
+def get_low_stock_products(limit=None):
+    """
+    Helper function to get products with low stock based on min_stock_level
+    limit caps the number of products in the query itself, for previews
+    """
+    # One query: each product's stock is worked out in SQL and compared there
+    products = annotate_realtime_quantity(
+        Product.objects.filter(is_active=True, min_stock_level__gt=0)
+    ).filter(realtime_quantity__lte=models.F('min_stock_level'))
+    if limit is not None:
+        products = products[:limit]
     low_stock = []
     for product in products:
-        qty = product.get_realtime_quantity()
-        if qty <= product.min_stock_level and product.min_stock_level > 0:
-            low_stock.append({
-                'product': product,
-                'current_quantity': qty,
-                'min_quantity': product.min_stock_level
-            })
+        low_stock.append({
+            'product': product,
+            'current_quantity': product.realtime_quantity,
+            'min_quantity': product.min_stock_level
+        })
     return low_stock
 
 
+def annotate_realtime_quantity(products):
+    """
+    Annotate a Product queryset with realtime_quantity: received goods less
+    delivered sales across all warehouses, as Product.get_realtime_quantity
+    works out (never below zero), but from two subqueries instead of two
+    queries per product.
+    """
+    from purchases.models import GoodsReceiptItem
+    from sales.models import SalesOrderItem
+    
+    quantity_field = models.DecimalField(max_digits=20, decimal_places=2)
+    received = GoodsReceiptItem.objects.filter(
+        product=models.OuterRef('pk'),
+        goods_receipt__status='received'
+    ).values('product').annotate(total=models.Sum('quantity')).values('total')
+    delivered = SalesOrderItem.objects.filter(
+        product=models.OuterRef('pk'),
+        sales_order__status='delivered'
+    ).values('product').annotate(total=models.Sum('quantity')).values('total')
+    
+    zero = models.Value(Decimal('0'), output_field=quantity_field)
+    return products.annotate(realtime_quantity=Greatest(
+        models.ExpressionWrapper(
+            Coalesce(models.Subquery(received), zero) - Coalesce(models.Subquery(delivered), zero),
+            output_field=quantity_field
+        ),
+        zero,
+        output_field=quantity_field
+    ))
+
+
+def annotate_latest_unit_cost(products):
+    """
+    Annotate a Product queryset with latest_unit_cost: the unit cost on the
+    product's most recent received goods receipt, or its cost_price if it has
+    none, as Product.get_total_stock_value values stock, from one subquery
+    instead of a lookup per product.
+    """
+    from purchases.models import GoodsReceiptItem
+    
+    latest = GoodsReceiptItem.objects.filter(
+        product=models.OuterRef('pk'),
+        goods_receipt__status='received'
+    ).order_by('-goods_receipt__receipt_date').values('unit_cost')[:1]
+    return products.annotate(latest_unit_cost=Coalesce(
+        models.Subquery(latest), models.F('cost_price'),
+        output_field=models.DecimalField(max_digits=15, decimal_places=2)
+    ))
+
+
+def get_realtime_quantities(product_ids, warehouse_ids):
+    """
+    Calculate real-time quantities for many products and warehouses at once.
+    Uses the same formula as Product.get_realtime_quantity, in one grouped query:
+    received goods per product/warehouse, less a subquery of delivered sales.
+    Returns a dict keyed by (product_id, warehouse_id); pairs with no stock are absent.
+    """
+    from purchases.models import GoodsReceiptItem
+    from sales.models import SalesOrderItem
+    
+    delivered = SalesOrderItem.objects.filter(
+        product_id=models.OuterRef('product_id'),
+        warehouse_id=models.OuterRef('warehouse_id'),
+        sales_order__status='delivered'
+    ).values('product_id').annotate(total=models.Sum('quantity')).values('total')
+    
+    # A pair never received can only have zero stock, so receipts drive the grouping
+    rows = GoodsReceiptItem.objects.filter(
+        product_id__in=product_ids,
+        warehouse_id__in=warehouse_ids,
+        goods_receipt__status='received'
+    ).values_list('product_id', 'warehouse_id').annotate(
+        received=models.Sum('quantity'),
+        delivered=Coalesce(models.Subquery(delivered), models.Value(Decimal('0')), output_field=models.DecimalField()),
+    )
+    
+    # Ensure non-negative, as get_realtime_quantity does
+    return {
+        (product_id, warehouse_id): max(Decimal('0'), received - delivered)
+        for product_id, warehouse_id, received, delivered in rows
+    }
+
+
 class Warehouse(models.Model):
     name = models.CharField(max_length=100)
     is_active = models.BooleanField(default=True)
@@ -29,6 +151,9 @@ class Warehouse(models.Model):
     class Meta:
         verbose_name = "Warehouse"
         verbose_name_plural = "Warehouses"
+        indexes = [
+            models.Index(fields=['is_active', 'name']),
+        ]
 
 
 class ProductCategory(models.Model):
@@ -40,6 +165,11 @@ class ProductCategory(models.Model):
 
     def __str__(self):
         return self.name
+    
+    @property
+    def is_tiles(self):
+        """Whether this is the Tiles category, whose products get carton/sqft breakdowns"""
+        return self.name.lower() == 'tiles'
 
     class Meta:
         verbose_name = "Product Category"
@@ -97,6 +227,7 @@ class Product(models.Model):
     cost_price = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     selling_price = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     min_stock_level = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    is_tile = models.BooleanField(default=False, editable=False, db_index=True, help_text="Set from the category; true for products in the Tiles category")
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -104,6 +235,10 @@ class Product(models.Model):
     def __str__(self):
         return f"{self.name} ({self.brand})"
     
+    def save(self, *args, **kwargs):
+        self.is_tile = bool(self.category and self.category.is_tiles)
+        super().save(*args, **kwargs)
+    
     def get_realtime_quantity(self, warehouse=None):
         """
         Calculate inventory quantity in real-time from transactions.
@@ -153,21 +288,25 @@ class Product(models.Model):
         """Alias for get_realtime_quantity for backward compatibility"""
         return self.get_realtime_quantity()
     
-    def get_total_stock_value(self):
-        """Calculate total stock value using real-time quantity"""
+    def get_total_stock_value(self, quantity=None, unit_cost=None):
+        """
+        Calculate total stock value using real-time quantity.
+        Pass quantity when the caller already has get_realtime_quantity() for
+        this product, and unit_cost when it has the latest_unit_cost annotation
+        (see annotate_latest_unit_cost), to save working them out again.
+        """
         try:
-            quantity = self.get_realtime_quantity()
-            # Use average unit cost from recent goods receipts if available
-            from purchases.models import GoodsReceiptItem
-            recent_receipts = GoodsReceiptItem.objects.filter(
-                product=self,
-                goods_receipt__status='received'
-            ).order_by('-goods_receipt__receipt_date')[:1]
-            
-            if recent_receipts.exists():
-                unit_cost = recent_receipts.first().unit_cost
-            else:
-                unit_cost = self.cost_price
+            if quantity is None:
+                quantity = self.get_realtime_quantity()
+            if unit_cost is None:
+                # Use the unit cost from the most recent goods receipt if available
+                from purchases.models import GoodsReceiptItem
+                unit_cost = GoodsReceiptItem.objects.filter(
+                    product=self,
+                    goods_receipt__status='received'
+                ).order_by('-goods_receipt__receipt_date').values_list('unit_cost', flat=True).first()
+                if unit_cost is None:
+                    unit_cost = self.cost_price
             
             return quantity * unit_cost
         except Exception as e:
@@ -0,0 +1,34 @@
+# Keep what is derived from categories and brands in step with them: each
+# product's stored tile flag and the cached filter options. Signals also fire
+# for queryset and admin bulk deletes; bulk updates send none, so callers
+# renaming categories that way run sync_tile_flags themselves.
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import PRODUCT_FILTERS_CACHE_KEY, Product, ProductBrand, ProductCategory, sync_tile_flags
+
+
+@receiver(post_save, sender=ProductCategory)
+def sync_category_tile_flags(sender, instance, raw=False, **kwargs):
+    """Re-flag a saved category's products, as a rename can make or unmake it Tiles"""
+    if raw:
+        return
+    sync_tile_flags(instance.products.all())
+
+
+@receiver(post_delete, sender=ProductCategory)
+def sync_uncategorized_tile_flags(sender, instance, **kwargs):
+    """Clear the flag on the deleted category's products, which are left without a category"""
+    sync_tile_flags(Product.objects.filter(category__isnull=True))
+
+
+@receiver([post_save, post_delete], sender=ProductCategory)
+@receiver([post_save, post_delete], sender=ProductBrand)
+def clear_product_filters(sender, **kwargs):
+    """
+    Drop the cached filter options once the change commits, so no request
+    caches the old rows again before then
+    """
+    transaction.on_commit(lambda: cache.delete(PRODUCT_FILTERS_CACHE_KEY))
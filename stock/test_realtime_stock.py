@@ -0,0 +1,196 @@
+"""
+Test cases for real-time stock, the product filter options and the tile flag
+"""
+
+from datetime import date
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from sales.models import SalesOrder, SalesOrderItem
+from stock.models import (
+    Product, ProductBrand, ProductCategory, UnitType,
+    annotate_latest_unit_cost, annotate_realtime_quantity, get_low_stock_products,
+    get_product_filters, get_realtime_quantities, sync_tile_flags,
+)
+from stock.testing import StockedProductMixin
+
+
+class RealtimeStockTest(StockedProductMixin, TestCase):
+    """Test cases for stock worked out from goods receipts and delivered sales"""
+    
+    def _deliver(self, product, quantity):
+        """Record a delivered sale of quantity units of product"""
+        order = SalesOrder.objects.create(
+            order_number=f'SO-{SalesOrder.objects.count() + 1}', order_date=date.today(), status='delivered'
+        )
+        SalesOrderItem.objects.create(
+            sales_order=order, product=product, warehouse=self.warehouse,
+            quantity=quantity, unit_price=Decimal('1.00'), total_price=quantity
+        )
+    
+    def test_stock_lookup_subtracts_deliveries(self):
+        """Test delivered sales reduce the batched quantity like get_realtime_quantity"""
+        self._deliver(self.product, Decimal('3'))
+        quantities = get_realtime_quantities([self.product.id], [self.warehouse.id])
+        self.assertEqual(quantities, {(self.product.id, self.warehouse.id): Decimal('7')})
+        self.assertEqual(self.product.get_realtime_quantity(warehouse=self.warehouse), Decimal('7'))
+    
+    def test_low_stock_products_in_one_query(self):
+        """Test low stock is found with one query, using get_realtime_quantity's formula"""
+        self._deliver(self.product, Decimal('4'))
+        Product.objects.filter(pk=self.product.pk).update(min_stock_level=Decimal('6'))
+        Product.objects.create(name='Never Received', unit_type=self.unit_type, min_stock_level=Decimal('1'))
+        Product.objects.create(name='No Minimum', unit_type=self.unit_type)
+        
+        with self.assertNumQueries(1):
+            low_stock = get_low_stock_products()
+        self.assertEqual(
+            [(row['product'].name, row['current_quantity'], row['min_quantity']) for row in low_stock],
+            [('Never Received', Decimal('0'), Decimal('1')), ('Test Product', Decimal('6'), Decimal('6'))]
+        )
+        
+        Product.objects.filter(pk=self.product.pk).update(min_stock_level=Decimal('5.99'))
+        self.assertEqual([row['product'].name for row in get_low_stock_products()], ['Never Received'])
+        
+        # A preview's limit goes into the query
+        Product.objects.filter(pk=self.product.pk).update(min_stock_level=Decimal('6'))
+        with self.assertNumQueries(1) as ctx:
+            low_stock = get_low_stock_products(limit=1)
+        self.assertIn('LIMIT 1', ctx.captured_queries[0]['sql'])
+        self.assertEqual(len(low_stock), 1)
+    
+    def test_stock_value_reuses_known_quantity(self):
+        """Test a quantity the caller already has isn't worked out again for the stock value"""
+        quantity = self.product.get_realtime_quantity()
+        with self.assertNumQueries(1):  # Only the latest receipt cost lookup
+            value = self.product.get_total_stock_value(quantity=quantity)
+        self.assertEqual(value, self.product.get_total_stock_value())
+        self.assertEqual(value, Decimal('500.00'))
+    
+    def test_stock_values_from_annotations(self):
+        """Test annotated stock and cost give each product's stock value without further queries"""
+        Product.objects.create(name='Never Received', unit_type=self.unit_type, cost_price=Decimal('7.00'))
+        with self.assertNumQueries(1):
+            products = list(annotate_latest_unit_cost(annotate_realtime_quantity(Product.objects.all())))
+            values = {
+                product.name: product.get_total_stock_value(
+                    quantity=product.realtime_quantity, unit_cost=product.latest_unit_cost
+                )
+                for product in products
+            }
+        # Products never received fall back to their cost price
+        self.assertEqual(
+            {product.name: product.latest_unit_cost for product in products},
+            {'Test Product': Decimal('50.00'), 'Never Received': Decimal('7.00')}
+        )
+        self.assertEqual(values, {'Test Product': Decimal('500.00'), 'Never Received': Decimal('0')})
+        self.assertEqual(values['Test Product'], self.product.get_total_stock_value())
+
+
+class ProductFiltersTest(TestCase):
+    """Test cases for the cached category and brand filter options"""
+    
+    def setUp(self):
+        cache.clear()
+    
+    def test_filters_cached_until_category_or_brand_changes(self):
+        """Test filter options are fetched once, then refreshed when a category or brand is saved or deleted"""
+        category = ProductCategory.objects.create(name='Cement')
+        ProductCategory.objects.create(name='Retired', is_active=False)
+        
+        with self.assertNumQueries(2):
+            filters = get_product_filters()
+        self.assertEqual(filters, {'categories': [{'id': category.id, 'name': 'Cement'}], 'brands': []})
+        with self.assertNumQueries(0):
+            get_product_filters()
+        
+        # Cleared when the change commits, not before
+        with self.captureOnCommitCallbacks(execute=True):
+            brand = ProductBrand.objects.create(name='Seven Rings')
+            self.assertEqual(get_product_filters()['brands'], [])
+        self.assertEqual(get_product_filters()['brands'], [{'id': brand.id, 'name': 'Seven Rings'}])
+        
+        category.name = 'Cement Bags'
+        with self.captureOnCommitCallbacks(execute=True):
+            category.save()
+        self.assertEqual(get_product_filters()['categories'], [{'id': category.id, 'name': 'Cement Bags'}])
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            brand.delete()
+        self.assertEqual(get_product_filters()['brands'], [])
+    
+    def test_filters_cleared_by_bulk_delete(self):
+        """Test deleting categories or brands through a queryset, as the admin does, refreshes the options"""
+        ProductCategory.objects.create(name='Cement')
+        ProductBrand.objects.create(name='Seven Rings')
+        get_product_filters()
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductCategory.objects.all().delete()
+            ProductBrand.objects.all().delete()
+        self.assertEqual(get_product_filters(), {'categories': [], 'brands': []})
+
+
+class ProductTileFlagTest(TestCase):
+    """Test cases for Product.is_tile following the product's category"""
+    
+    def test_tile_flag_follows_category(self):
+        """Test products pick up and drop the tile flag as their category changes"""
+        tiles = ProductCategory.objects.create(name='Tiles')
+        other = ProductCategory.objects.create(name='Cement')
+        product = Product.objects.create(
+            name='Tile', category=other, unit_type=UnitType.objects.create(code='pcs', name='Pieces')
+        )
+        self.assertFalse(product.is_tile)
+        
+        product.category = tiles
+        product.save()
+        self.assertTrue(product.is_tile)
+        
+        other.name = 'TILES'
+        tiles.name = 'Old Tiles'
+        tiles.save()
+        product.refresh_from_db()
+        self.assertFalse(product.is_tile)
+        
+        product.category = other
+        product.save()
+        other.save()
+        product.refresh_from_db()
+        self.assertTrue(product.is_tile)
+        
+        other.delete()
+        product.refresh_from_db()
+        self.assertFalse(product.is_tile)
+    
+    def test_tile_flag_cleared_by_bulk_delete(self):
+        """Test deleting categories through a queryset, as the admin does, drops their products' flag"""
+        tiles = ProductCategory.objects.create(name='Tiles')
+        product = Product.objects.create(
+            name='Tile', category=tiles, unit_type=UnitType.objects.create(code='pcs', name='Pieces')
+        )
+        self.assertTrue(product.is_tile)
+        
+        ProductCategory.objects.filter(pk=tiles.pk).delete()
+        product.refresh_from_db()
+        self.assertIsNone(product.category)
+        self.assertFalse(product.is_tile)
+    
+    def test_sync_tile_flags_after_bulk_rename(self):
+        """Test sync_tile_flags brings the flag back in step after a queryset rename"""
+        category = ProductCategory.objects.create(name='Cement')
+        product = Product.objects.create(
+            name='Tile', category=category, unit_type=UnitType.objects.create(code='pcs', name='Pieces')
+        )
+        
+        ProductCategory.objects.filter(pk=category.pk).update(name='Tiles')
+        sync_tile_flags(Product.objects.all())
+        product.refresh_from_db()
+        self.assertTrue(product.is_tile)
+        
+        ProductCategory.objects.filter(pk=category.pk).update(name='Cement')
+        sync_tile_flags(Product.objects.all())
+        product.refresh_from_db()
+        self.assertFalse(product.is_tile)
@@ -0,0 +1,55 @@
+"""
+Shared test fixtures for code that works with real-time stock
+"""
+
+from datetime import date
+from decimal import Decimal
+
+from purchases.models import PurchaseOrder, PurchaseOrderItem, GoodsReceipt, GoodsReceiptItem
+from suppliers.models import Supplier
+from stock.models import Product, UnitType, Warehouse
+
+
+class StockedProductMixin:
+    """
+    TestCase mixin setting up cls.product with 10 units received into
+    cls.warehouse at 50.00 each, along with its cls.unit_type
+    """
+    
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.unit_type = UnitType.objects.create(code='pcs', name='Pieces')
+        cls.warehouse = Warehouse.objects.create(name='Main Warehouse')
+        cls.product = Product.objects.create(
+            name='Test Product',
+            unit_type=cls.unit_type,
+            selling_price=Decimal('100.00'),
+            is_active=True
+        )
+        purchase_order = PurchaseOrder.objects.create(
+            supplier=Supplier.objects.create(name='Test Supplier'),
+            order_date=date.today(),
+            expected_date=date.today()
+        )
+        order_item = PurchaseOrderItem.objects.create(
+            purchase_order=purchase_order,
+            product=cls.product,
+            quantity=Decimal('10'),
+            unit_price=Decimal('50.00'),
+            total_price=Decimal('500.00')
+        )
+        receipt = GoodsReceipt.objects.create(
+            purchase_order=purchase_order,
+            receipt_date=date.today(),
+            status='received'
+        )
+        GoodsReceiptItem.objects.create(
+            goods_receipt=receipt,
+            purchase_order_item=order_item,
+            product=cls.product,
+            warehouse=cls.warehouse,
+            quantity=Decimal('10'),
+            unit_cost=Decimal('50.00'),
+            total_cost=Decimal('500.00')
+        )
@@ -8,7 +8,10 @@ from django.contrib import messages
 from django.http import JsonResponse
 from datetime import datetime, timedelta
 from decimal import Decimal
-from .models import ProductCategory, ProductBrand, UnitType, Product, Warehouse, get_low_stock_products
+from .models import (
+    ProductCategory, ProductBrand, UnitType, Product, Warehouse, get_low_stock_products,
+    annotate_latest_unit_cost, annotate_realtime_quantity
+)
 from .forms import (
     ProductForm, ProductCategoryForm, ProductBrandForm, UnitTypeForm, WarehouseForm,
     ProductSearchForm, StockReportForm
@@ -128,7 +131,8 @@ class StockListView(ListView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        products = self.get_queryset()
+        # Stock is valued at each product's latest receipt cost, fetched with the products
+        products = annotate_latest_unit_cost(self.get_queryset())
         
         # Get selected warehouse filter
         warehouse_id = self.request.GET.get('warehouse')
@@ -199,7 +203,7 @@ class StockListView(ListView):
                 )
                 product_value = sum(item.total_cost for item in warehouse_items)
             else:
-                product_value = product.get_total_stock_value()
+                product_value = product.get_total_stock_value(quantity=qty, unit_cost=product.latest_unit_cost)
             
             total_stock_value += product_value
             
@@ -260,7 +264,7 @@ class StockDetailView(DetailView):
         context = super().get_context_data(**kwargs)
         product = self.get_object()
         context['current_qty'] = product.get_realtime_quantity()
-        context['total_value'] = product.get_total_stock_value()
+        context['total_value'] = product.get_total_stock_value(quantity=context['current_qty'])
         return context
 
 
@@ -413,12 +417,13 @@ class StockReportView(ListView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        products = self.get_queryset()
+        # Each product's stock and latest receipt cost come with it, in one query
+        products = annotate_latest_unit_cost(annotate_realtime_quantity(self.get_queryset()))
         
         report_data = []
         for product in products:
-            qty = product.get_realtime_quantity()
-            value = product.get_total_stock_value()
+            qty = product.realtime_quantity
+            value = product.get_total_stock_value(quantity=qty, unit_cost=product.latest_unit_cost)
             status = 'out_of_stock' if qty <= 0 else 'low_stock' if qty <= product.min_stock_level else 'in_stock'
             
             report_data.append({
@@ -443,13 +448,14 @@ class StockValuationReportView(ListView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        products = self.get_queryset()
+        # Each product's stock and latest receipt cost come with it, in one query
+        products = annotate_latest_unit_cost(annotate_realtime_quantity(self.get_queryset()))
         
         total_value = 0
         valuation_data = []
         for product in products:
-            qty = product.get_realtime_quantity()
-            value = product.get_total_stock_value()
+            qty = product.realtime_quantity
+            value = product.get_total_stock_value(quantity=qty, unit_cost=product.latest_unit_cost)
             total_value += value
             
             if qty > 0:
@@ -74,5 +74,8 @@ class SupplierLedger(models.Model):
     class Meta:
         verbose_name = "Supplier Ledger"
         verbose_name_plural = "Supplier Ledgers"
+        indexes = [
+            models.Index(fields=['transaction_type', 'transaction_date']),
+        ]
 
 